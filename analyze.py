@@ -6,44 +6,259 @@ import chess
 import chess.pgn
 import chess.engine
 from typing import List, Dict, Any, Tuple, Optional
+import asyncio
+import atexit
+import os
+import queue
+import threading
 import time
+from bisect import bisect_left
 from io import StringIO
 
+# Bump when the analysis logic changes (e.g. the color-detection fix) so
+# games analyzed by older versions get picked up for reanalysis. Lives
+# here so every script that runs analyze_game stamps the same version.
+ANALYZER_VERSION = 2
+
+# Fixed node budget per position. Unlike a time limit this gives
+# deterministic work per call (same FEN + Threads=1 -> same score), which
+# keeps the eval cache reproducible and load-balances the engine pool.
+ANALYSIS_NODES = 100_000
+
+class AsyncEnginePool:
+    """
+    N single-threaded Stockfish engines driven by one background asyncio
+    event loop. Position batches are pipelined to whichever engine is free,
+    without the pickling round-trips of a process pool, and the engine
+    processes stay alive (TT warm) across games.
+    """
+
+    def __init__(self, engine_path: str, size: int = None):
+        """
+        Start the event loop thread and spawn the engines.
+
+        Args:
+            engine_path: Path to Stockfish executable
+            size: Number of engines (default: CPU count)
+        """
+        self.engine_path = engine_path
+        self.size = size or os.cpu_count() or 1
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        self._submit(self._start()).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _submit(self, coro):
+        """Schedule a coroutine on the background loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _start(self):
+        self.free = asyncio.Queue()
+        self.protocols = []
+        for _ in range(self.size):
+            transport, protocol = await chess.engine.popen_uci(self.engine_path)
+            await protocol.configure({"Threads": 1, "Hash": 16})
+            self.protocols.append(protocol)
+            self.free.put_nowait(protocol)
+
+    async def _analyse_one(self, fen: str, game_token: str) -> int:
+        engine = await self.free.get()
+        try:
+            board = chess.Board(fen)
+            # Only the score is consumed, so have python-chess discard the
+            # other info lines (pv, nodes, nps, ...) instead of parsing them
+            info = await engine.analyse(board, chess.engine.Limit(nodes=ANALYSIS_NODES),
+                                        game=game_token, info=chess.engine.INFO_SCORE)
+            score = info.get('score', None)
+            if score is None:
+                return 0
+            return score.white().score(mate_score=10000)
+        finally:
+            self.free.put_nowait(engine)
+
+    async def _analyse_many(self, fens: List[str], game_token: str) -> List[int]:
+        return await asyncio.gather(*(self._analyse_one(fen, game_token) for fen in fens))
+
+    def evaluate(self, fens: List[str], game_token: str = '') -> List[int]:
+        """
+        Evaluate a batch of FENs concurrently.
+
+        Args:
+            fens: FEN strings to evaluate
+            game_token: Token shared by positions from the same game so
+                python-chess skips `ucinewgame` between them
+
+        Returns:
+            Centipawn scores (White's perspective), in input order
+        """
+        return self._submit(self._analyse_many(list(fens), game_token)).result()
+
+    def shutdown(self):
+        """Quit the engines and stop the event loop."""
+        async def _quit_all():
+            for protocol in self.protocols:
+                try:
+                    await protocol.quit()
+                except Exception:
+                    pass
+        try:
+            self._submit(_quit_all()).result(timeout=10)
+        except Exception:
+            pass
+        self.protocols = []
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+class EnginePool:
+    """Pool of persistent Stockfish engines shared across analyses."""
+
+    def __init__(self, engine_path: str, size: int = 1):
+        """
+        Initialize the pool.
+
+        Args:
+            engine_path: Path to Stockfish executable
+            size: Number of engines to keep alive
+        """
+        self.engine_path = engine_path
+        self.engines = []
+        self.idle = queue.Queue()
+        for _ in range(size):
+            engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+            self.engines.append(engine)
+            self.idle.put(engine)
+
+    def acquire(self) -> chess.engine.SimpleEngine:
+        """Check out an idle engine, blocking until one is free."""
+        return self.idle.get()
+
+    def release(self, engine: chess.engine.SimpleEngine):
+        """Return an engine to the pool without quitting it."""
+        self.idle.put(engine)
+
+    def shutdown(self):
+        """Quit all engines cleanly."""
+        for engine in self.engines:
+            try:
+                engine.quit()
+            except Exception:
+                pass
+        self.engines = []
+
+# Shared pool, created lazily on first engine use so the Stockfish
+# processes (and their transposition tables) stay warm across games.
+_engine_pool = None
+
+def get_engine_pool(engine_path: str) -> EnginePool:
+    """Get or create the shared EnginePool for the given engine path."""
+    global _engine_pool
+    if _engine_pool is None:
+        _engine_pool = EnginePool(engine_path)
+        atexit.register(_engine_pool.shutdown)
+    return _engine_pool
+
 class ChessAnalyzer:
     """Handles chess analysis using Stockfish engine."""
     
-    def __init__(self, engine_path: str = r"C:\Users\Alex\Downloads\stockfish-windows-x86-64-avx2.exe"):
+    def __init__(self, engine_path: str = r"C:\Users\Alex\Downloads\stockfish-windows-x86-64-avx2.exe", db=None,
+                 pool_size: int = None):
         """
         Initialize the analyzer with Stockfish engine.
-        
+
         Args:
             engine_path: Path to Stockfish executable (default: user's download path)
+            db: Optional ChessDatabase used as a persistent eval cache
+            pool_size: Engines in this analyzer's pool (default: CPU count).
+                Process-pool workers must pass 1 so the machine isn't
+                oversubscribed with cpu_count engines per worker.
         """
         self.engine_path = engine_path
         self.engine = None
+        self.pool = None
+        self.pool_size = pool_size
+        self.db = db
+        self._last_game = None  # Parsed game from the most recent analyze_game
         self.blunder_threshold = -1.5  # Evaluation drop threshold for blunders
         self.mistake_threshold = -0.8  # Evaluation drop threshold for mistakes
         self.inaccuracy_threshold = -0.3  # Evaluation drop threshold for inaccuracies
-        
+        # Sorted thresholds + labels so classification is one bisect instead
+        # of a branch chain per ply. The hot path compares integer
+        # centipawns straight from the engine, converting to pawns only at
+        # the API boundary.
+        self.error_thresholds = (self.blunder_threshold, self.mistake_threshold, self.inaccuracy_threshold)
+        self.error_thresholds_cp = tuple(int(t * 100) for t in self.error_thresholds)
+        self.error_labels = ("Blunder", "Mistake", "Inaccuracy", "Good")
+
     def initialize_engine(self) -> bool:
         """
-        Initialize the Stockfish engine.
-        
+        Acquire a Stockfish engine from the shared pool.
+
         Returns:
             True if successful, False otherwise
         """
         try:
-            self.engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+            self.engine = get_engine_pool(self.engine_path).acquire()
             return True
         except Exception as e:
             print(f"Error initializing Stockfish engine: {e}")
             print("Make sure Stockfish is installed and accessible via PATH")
             return False
-    
+
     def close_engine(self):
-        """Close the Stockfish engine."""
+        """Release the engine back to the pool and stop the worker pool."""
         if self.engine:
-            self.engine.quit()
+            get_engine_pool(self.engine_path).release(self.engine)
+            self.engine = None
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def get_pool(self) -> AsyncEnginePool:
+        """
+        Get the persistent pool of single-threaded Stockfish engines.
+
+        The pool is created on first use and reused across games so the
+        engine processes stay warm.
+
+        Returns:
+            AsyncEnginePool sized pool_size (one engine per CPU by default)
+        """
+        if self.pool is None:
+            self.pool = AsyncEnginePool(self.engine_path, size=self.pool_size)
+        return self.pool
+
+    def evaluate_positions(self, fens: List[str], game_token: str = '') -> Dict[str, int]:
+        """
+        Evaluate a batch of positions across the worker pool.
+
+        Args:
+            fens: List of FEN strings to evaluate
+            game_token: Token identifying the source game, shared across the
+                batch so workers keep their transposition tables between plies
+
+        Returns:
+            Dictionary mapping each unique FEN to centipawns (White's perspective)
+        """
+        unique_fens = list(dict.fromkeys(fens))  # Dedup, preserving order
+
+        # Check the persistent eval cache first - opening positions repeat
+        # across a user's games, and every hit saves a full engine search
+        evals = {}
+        if self.db:
+            evals = self.db.get_cached_evals(unique_fens)
+        misses = [fen for fen in unique_fens if fen not in evals]
+
+        if misses:
+            scores = self.get_pool().evaluate(misses, game_token)
+            fresh = dict(zip(misses, scores))
+            evals.update(fresh)
+            if self.db:
+                self.db.save_evals(fresh)
+
+        return evals
     
     def get_san_move(self, board: chess.Board, move: chess.Move) -> str:
         """
@@ -72,30 +287,35 @@ class ChessAnalyzer:
         Returns:
             Error type string
         """
-        if eval_change <= self.blunder_threshold:
-            return "Blunder"
-        elif eval_change <= self.mistake_threshold:
-            return "Mistake"
-        elif eval_change <= self.inaccuracy_threshold:
-            return "Inaccuracy"
-        else:
-            return "Good"
+        return self.error_labels[bisect_left(self.error_thresholds, eval_change)]
+
+    def classify_eval_changes(self, eval_changes_cp: List[int]) -> List[str]:
+        """
+        Classify a batch of evaluation changes in one pass.
+
+        Args:
+            eval_changes_cp: Evaluation changes in centipawns, one per analyzed ply
+
+        Returns:
+            List of error type strings
+        """
+        thresholds = self.error_thresholds_cp
+        labels = self.error_labels
+        return [labels[bisect_left(thresholds, change)] for change in eval_changes_cp]
     
-    def analyze_game(self, pgn: str, username: str) -> List[Dict[str, Any]]:
+    def analyze_game(self, pgn: str, username: str, max_plies: int = 120) -> List[Dict[str, Any]]:
         """
         Analyze a game and find errors for the specified player.
-        
+
         Args:
             pgn: PGN string of the game
             username: Username of the player to analyze
-            
+            max_plies: Stop analyzing past this many plies - long endgame
+                tails dominate engine time but rarely change the error picture
+
         Returns:
             List of error dictionaries
         """
-        if not self.engine:
-            if not self.initialize_engine():
-                return []
-        
         try:
             # Parse the game using StringIO to convert string to file-like object
             pgn_io = StringIO(pgn)
@@ -103,7 +323,11 @@ class ChessAnalyzer:
             if not game:
                 print("Could not parse PGN")
                 return []
-            
+
+            # Keep the parsed game around so callers inspecting the analysis
+            # afterwards (e.g. test_analysis) don't pay for a second parse
+            self._last_game = game
+
             # Determine if the player is White or Black
             white_player = game.headers.get('White', '').lower()
             black_player = game.headers.get('Black', '').lower()
@@ -117,77 +341,55 @@ class ChessAnalyzer:
             is_player_black = username_lower == black_player
             
             board = game.board()
-            errors = []
             move_number = 1
-            
-            # Analyze each move
+
+            # Phase 1: walk the game once, recording positions to evaluate.
+            # No engine calls here - just cheap PGN traversal. FEN strings are
+            # only materialized for analyzed plies and carried forward so no
+            # board state is serialized twice (board.fen() scans all 64
+            # squares, which adds up inside this loop).
+            # Per-ply data is kept as parallel lists (struct-of-arrays)
+            # instead of a dict per ply to avoid per-entry hash-table
+            # overhead; dicts are only built for the errors returned.
+            move_numbers = []
+            uci_moves = []
+            fens_before = []
+            fens_after = []
+            white_turns = []
+            current_fen = None  # FEN of the current board state, if built
             for move in game.mainline_moves():
+                if move_number > max_plies:
+                    break
                 try:
-                    # Get position before the move
-                    fen_before = board.fen()
                     is_white_turn = board.turn == chess.WHITE
-                    
+
                     # Only analyze moves made by the specified player
                     should_analyze = (is_white_turn and is_player_white) or (not is_white_turn and is_player_black)
-                    
+
+                    # A forced move (only legal reply) can't be an error, so
+                    # don't spend an engine search proving it
+                    if should_analyze and board.legal_moves.count() == 1:
+                        should_analyze = False
+
                     if should_analyze:
-                        # Get SAN notation for the move BEFORE making it
-                        try:
-                            san_move = board.san(move)
-                        except (ValueError, AttributeError):
-                            san_move = move.uci()
-                        
-                        # Get evaluation before the move
-                        info_before = self.engine.analyse(board, chess.engine.Limit(time=0.1))
-                        eval_before = info_before.get('score', None)
-                        if eval_before is None:
-                            eval_before_centipawns = 0
-                        else:
-                            eval_before_centipawns = eval_before.white().score(mate_score=10000)
-                        
-                        # Make the move
-                        board.push(move)
-                        
-                        # Get evaluation after the move
-                        info_after = self.engine.analyse(board, chess.engine.Limit(time=0.1))
-                        eval_after = info_after.get('score', None)
-                        if eval_after is None:
-                            eval_after_centipawns = 0
-                        else:
-                            eval_after_centipawns = eval_after.white().score(mate_score=10000)
-                        
-                        # Calculate evaluation change from the perspective of the player who made the move
-                        if is_white_turn:
-                            # White's move: positive eval means White is winning
-                            eval_change = eval_after_centipawns - eval_before_centipawns
-                        else:
-                            # Black's move: need to flip perspective since Stockfish evaluates from White's perspective
-                            eval_change = -eval_after_centipawns - (-eval_before_centipawns)
-                        
-                        eval_change_pawns = eval_change / 100.0
-                        
-                        # Check if this is an error (evaluation drop)
-                        if eval_change_pawns <= self.inaccuracy_threshold:
-                            error_type = self.get_error_type(eval_change_pawns)
-                            
-                            error = {
-                                'move_number': move_number,
-                                'move': move.uci(),
-                                'fen_before': fen_before,
-                                'eval_before': eval_before_centipawns / 100.0,  # Convert to pawns
-                                'eval_after': eval_after_centipawns / 100.0,
-                                'eval_change': eval_change_pawns,
-                                'san_move': san_move,
-                                'error_type': error_type,
-                                'player': 'White' if is_player_white else 'Black'  # Use the player's actual color, not whose turn it is
-                            }
-                            errors.append(error)
+                        if current_fen is None:
+                            current_fen = board.fen()
+                        fen_before = current_fen
+
+                    board.push(move)
+
+                    if should_analyze:
+                        current_fen = board.fen()
+                        move_numbers.append(move_number)
+                        uci_moves.append(move.uci())
+                        fens_before.append(fen_before)
+                        fens_after.append(current_fen)
+                        white_turns.append(is_white_turn)
                     else:
-                        # Just make the move without analyzing
-                        board.push(move)
-                    
+                        current_fen = None
+
                     move_number += 1
-                    
+
                 except Exception as e:
                     # Log the error but continue with analysis
                     print(f"  Error analyzing move {move_number}: {e}")
@@ -197,9 +399,68 @@ class ChessAnalyzer:
                         move_number += 1
                     except:
                         break
-            
+
+            if not move_numbers:
+                return []
+
+            # Phase 2: evaluate all needed positions concurrently across the
+            # engine pool. The list stays in game order so engines see
+            # consecutive plies, and duplicates (a ply's after-position
+            # doubling as a later ply's before-position) are collapsed so
+            # every position is searched exactly once.
+            fens_needed = []
+            for fen_before, fen_after in zip(fens_before, fens_after):
+                fens_needed.append(fen_before)
+                fens_needed.append(fen_after)
+            evals = self.evaluate_positions(fens_needed, game_token=game.headers.get('Link', pgn[:64]))
+
+            # Zip the scores back and compute per-ply evaluation changes.
+            # Everything stays in integer centipawns - Stockfish's native
+            # unit - with no float math until the error dicts are built.
+            evals_before_cp = [evals[fen] for fen in fens_before]
+            evals_after_cp = [evals[fen] for fen in fens_after]
+            eval_changes_cp = []
+            for eval_before_centipawns, eval_after_centipawns, is_white_turn in zip(
+                    evals_before_cp, evals_after_cp, white_turns):
+                # Evaluation change from the mover's perspective: Stockfish
+                # scores from White's side, so Black's change is the negation
+                if is_white_turn:
+                    eval_change_cp = eval_after_centipawns - eval_before_centipawns
+                else:
+                    eval_change_cp = eval_before_centipawns - eval_after_centipawns
+                eval_changes_cp.append(eval_change_cp)
+
+            # Classify all plies in one batch, then keep the errors.
+            # Dicts are only constructed here, at the API boundary.
+            error_types = self.classify_eval_changes(eval_changes_cp)
+            player = 'White' if is_player_white else 'Black'  # The player's actual color, not whose turn it is
+
+            errors = []
+            for i, error_type in enumerate(error_types):
+                if error_type == 'Good':
+                    continue
+                # SAN needs legal-move generation for disambiguation, so it is
+                # only computed here for the handful of flagged plies rather
+                # than for every move in the walk
+                try:
+                    san_move = chess.Board(fens_before[i]).san(chess.Move.from_uci(uci_moves[i]))
+                except (ValueError, AttributeError):
+                    san_move = uci_moves[i]
+                error = {
+                    'move_number': move_numbers[i],
+                    'move': uci_moves[i],
+                    'fen_before': fens_before[i],
+                    'eval_before': evals_before_cp[i] / 100.0,  # Convert to pawns
+                    'eval_after': evals_after_cp[i] / 100.0,
+                    'eval_change': eval_changes_cp[i] / 100.0,
+                    'san_move': san_move,
+                    'error_type': error_type,
+                    'player': player
+                }
+                errors.append(error)
+
             return errors
-            
+
         except Exception as e:
             print(f"Error analyzing game: {e}")
             return []
@@ -244,11 +505,41 @@ class ChessAnalyzer:
         
         try:
             board = chess.Board(fen)
-            info = self.engine.analyse(board, chess.engine.Limit(time=time_limit))
+            info = self.engine.analyse(board, chess.engine.Limit(time=time_limit), info=chess.engine.INFO_SCORE)
             score = info.get('score', None)
             if score is None:
                 return None
             return score.white().score(mate_score=10000) / 100.0
         except Exception as e:
             print(f"Error getting position evaluation: {e}")
-            return None 
\ No newline at end of file
+            return None
+
+    def get_position_evaluations(self, fens: List[str], time_limit: float = 0.5) -> List[Optional[float]]:
+        """
+        Get evaluations for a batch of positions.
+
+        Args:
+            fens: FEN strings of the positions
+            time_limit: Time limit per position in seconds
+
+        Returns:
+            Evaluations in pawns (None for positions that failed), in input order
+        """
+        if not self.engine:
+            if not self.initialize_engine():
+                return [None] * len(fens)
+
+        # One board reset via set_fen per position - reuses the allocated
+        # bitboard structures instead of constructing a fresh Board each time
+        board = chess.Board()
+        evals = []
+        for fen in fens:
+            try:
+                board.set_fen(fen)
+                info = self.engine.analyse(board, chess.engine.Limit(time=time_limit), info=chess.engine.INFO_SCORE)
+                score = info.get('score', None)
+                evals.append(None if score is None else score.white().score(mate_score=10000) / 100.0)
+            except Exception as e:
+                print(f"Error getting position evaluation: {e}")
+                evals.append(None)
+        return evals 
\ No newline at end of file
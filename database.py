@@ -3,9 +3,11 @@
 Database module for caching chess game analysis results.
 """
 
+import atexit
 import sqlite3
 import json
 import hashlib
+import zlib
 from typing import List, Dict, Any, Optional
 import os
 from datetime import datetime
@@ -21,13 +23,39 @@ class ChessDatabase:
             db_path: Path to SQLite database file
         """
         self.db_path = db_path
+        self._conn = None
         self.init_database()
-    
+
+    def conn(self) -> sqlite3.Connection:
+        """
+        Get the shared database connection, opening it on first use.
+
+        One connection per process keeps SQLite's page cache and prepared
+        statements warm instead of reconnecting on every call.
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA temp_store=MEMORY')
+            self._conn.execute('PRAGMA cache_size=-65536')
+            self._conn.execute('PRAGMA mmap_size=268435456')
+            atexit.register(self.close)
+        return self._conn
+
+    def close(self):
+        """Close the shared connection if open."""
+        if self._conn is not None:
+            # Let SQLite refresh stale statistics for the query planner
+            self._conn.execute('PRAGMA optimize')
+            self._conn.close()
+            self._conn = None
+
     def init_database(self):
         """Initialize database tables."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
-            
+
             # Games table - stores game metadata
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS games (
@@ -40,9 +68,16 @@ class ChessDatabase:
                     result TEXT NOT NULL,
                     date_played TEXT,
                     date_added TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    analyzed BOOLEAN DEFAULT FALSE
+                    analyzed BOOLEAN DEFAULT FALSE,
+                    analyzer_version INTEGER DEFAULT 0
                 )
             ''')
+
+            # Older databases predate the analyzer_version column
+            try:
+                cursor.execute('ALTER TABLE games ADD COLUMN analyzer_version INTEGER DEFAULT 0')
+            except sqlite3.OperationalError:
+                pass
             
             # Analysis table - stores analysis results
             cursor.execute('''
@@ -53,9 +88,9 @@ class ChessDatabase:
                     move TEXT NOT NULL,
                     san_move TEXT NOT NULL,
                     fen_before TEXT NOT NULL,
-                    eval_before REAL NOT NULL,
-                    eval_after REAL NOT NULL,
-                    eval_change REAL NOT NULL,
+                    eval_before INTEGER NOT NULL,
+                    eval_after INTEGER NOT NULL,
+                    eval_change INTEGER NOT NULL,
                     error_type TEXT NOT NULL,
                     player TEXT NOT NULL,
                     date_analyzed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -63,29 +98,114 @@ class ChessDatabase:
                 )
             ''')
             
+            # Eval cache table - persistent FEN -> evaluation transposition table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS eval_cache (
+                    fen TEXT PRIMARY KEY,
+                    cp INTEGER NOT NULL,
+                    ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
             # Create indexes for better performance
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_username ON games (username)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_analyzed ON games (analyzed)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_game_id ON analysis (game_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_player ON analysis (player)')
+            # Partial covering index so the unanalyzed-games query is an
+            # index-only scan with no sort step
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_games_unanalyzed
+                ON games (username, analyzed, date_added DESC)
+                WHERE analyzed = FALSE
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_game_error ON analysis (game_id, error_type)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_analysis_date ON analysis (date_analyzed)')
             
             conn.commit()
     
+    @staticmethod
+    def compress_pgn(pgn: str) -> bytes:
+        """
+        Compress PGN text for storage.
+
+        PGN is highly redundant (repeated tag names and SAN tokens), so
+        compressing keeps the database file small and more of it in the
+        page cache. SQLite's dynamic typing stores the blob in the
+        existing pgn column.
+        """
+        return zlib.compress(pgn.encode('utf-8'), 6)
+
+    @staticmethod
+    def decompress_pgn(value) -> str:
+        """Decompress a stored PGN, passing legacy uncompressed rows through."""
+        if isinstance(value, bytes):
+            return zlib.decompress(value).decode('utf-8')
+        return value or ''
+
+    @staticmethod
+    def normalize_fen(fen: str) -> str:
+        """
+        Normalize a FEN string for use as an eval-cache key.
+
+        Drops the halfmove/fullmove counters so trivially-equivalent
+        positions (same pieces, side to move, castling and en passant
+        rights) share a cache entry.
+        """
+        return ' '.join(fen.split(' ')[:4])
+
+    def get_cached_evals(self, fens: List[str]) -> Dict[str, int]:
+        """
+        Look up cached evaluations for a batch of positions.
+
+        Args:
+            fens: List of FEN strings
+
+        Returns:
+            Dictionary mapping each FEN with a cache hit to centipawns
+        """
+        if not fens:
+            return {}
+        keys = {self.normalize_fen(fen): fen for fen in fens}
+        with self.conn() as conn:
+            cursor = conn.cursor()
+            placeholders = ','.join('?' * len(keys))
+            cursor.execute(f'SELECT fen, cp FROM eval_cache WHERE fen IN ({placeholders})',
+                           list(keys.keys()))
+            return {keys[row[0]]: row[1] for row in cursor.fetchall() if row[0] in keys}
+
+    def save_evals(self, evals: Dict[str, int]):
+        """
+        Store evaluations in the persistent cache.
+
+        Args:
+            evals: Dictionary mapping FEN strings to centipawns
+        """
+        if not evals:
+            return
+        with self.conn() as conn:
+            conn.executemany('INSERT OR REPLACE INTO eval_cache (fen, cp) VALUES (?, ?)',
+                             [(self.normalize_fen(fen), cp) for fen, cp in evals.items()])
+            conn.commit()
+
     def generate_game_id(self, pgn: str, username: str) -> str:
         """Generate a unique game ID based on PGN and username."""
-        content = f"{pgn[:100]}{username}"  # Use first 100 chars of PGN + username
-        return hashlib.md5(content.encode()).hexdigest()
+        # Hash the full PGN - the first 100 chars are mostly shared headers,
+        # which caused ID collisions between distinct games. blake2b is much
+        # faster than md5 and this is only a dedupe key, not crypto.
+        content = f"{pgn}{username}"
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
     
     def game_exists(self, game_id: str) -> bool:
         """Check if a game already exists in the database."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT 1 FROM games WHERE game_id = ?', (game_id,))
             return cursor.fetchone() is not None
     
     def game_analyzed(self, game_id: str) -> bool:
         """Check if a game has been analyzed."""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT analyzed FROM games WHERE game_id = ?', (game_id,))
             result = cursor.fetchone()
@@ -108,7 +228,7 @@ class ChessDatabase:
         if self.game_exists(game_id):
             return game_id
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO games (game_id, username, pgn, white_player, black_player, result, date_played)
@@ -116,7 +236,7 @@ class ChessDatabase:
             ''', (
                 game_id,
                 username,
-                pgn,
+                self.compress_pgn(pgn),
                 game_data.get('white', {}).get('username', ''),
                 game_data.get('black', {}).get('username', ''),
                 game_data.get('white', {}).get('result', ''),
@@ -126,6 +246,44 @@ class ChessDatabase:
         
         return game_id
     
+    def add_games(self, games: List[Dict[str, Any]], username: str) -> List[str]:
+        """
+        Add many games in one transaction.
+
+        One executemany and one fsync for the whole batch, instead of an
+        INSERT plus commit per game.
+
+        Args:
+            games: Game data dictionaries from the Chess.com API
+            username: Username of the player
+
+        Returns:
+            Game IDs in the same order as the input
+        """
+        game_ids = []
+        rows = []
+        for game_data in games:
+            pgn = game_data.get('pgn', '')
+            game_id = self.generate_game_id(pgn, username)
+            game_ids.append(game_id)
+            rows.append((
+                game_id,
+                username,
+                self.compress_pgn(pgn),
+                game_data.get('white', {}).get('username', ''),
+                game_data.get('black', {}).get('username', ''),
+                game_data.get('white', {}).get('result', ''),
+                game_data.get('end_time', '')
+            ))
+        if rows:
+            with self.conn() as conn:
+                conn.executemany('''
+                    INSERT OR IGNORE INTO games (game_id, username, pgn, white_player, black_player, result, date_played)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+        return game_ids
+
     def save_analysis(self, game_id: str, errors: List[Dict[str, Any]]):
         """
         Save analysis results for a game.
@@ -134,34 +292,73 @@ class ChessDatabase:
             game_id: Game ID
             errors: List of error dictionaries from analysis
         """
-        with sqlite3.connect(self.db_path) as conn:
+        self.save_analyses([(game_id, errors)])
+
+    @staticmethod
+    def _analysis_rows(game_id: str, errors: List[Dict[str, Any]]) -> List[tuple]:
+        """Build insert tuples for one game's errors."""
+        return [(
+            game_id,
+            error.get('move_number', 0),
+            error.get('move', ''),
+            error.get('san_move', ''),
+            error.get('fen_before', ''),
+            # Evals are stored as integer centipawns - exact round trip
+            # and 2-8 byte varints instead of 8-byte REALs
+            int(round(error.get('eval_before', 0.0) * 100)),
+            int(round(error.get('eval_after', 0.0) * 100)),
+            int(round(error.get('eval_change', 0.0) * 100)),
+            error.get('error_type', ''),
+            error.get('player', '')
+        ) for error in errors]
+
+    def save_analyses(self, results: List[tuple], analyzer_version: int = 0):
+        """
+        Save analysis results for many games in a single transaction.
+
+        Args:
+            results: List of (game_id, errors) tuples
+            analyzer_version: Version of the analysis logic that produced them
+        """
+        if not results:
+            return
+        game_ids = [(game_id,) for game_id, _ in results]
+        rows = [row for game_id, errors in results for row in self._analysis_rows(game_id, errors)]
+        # Clear, bulk-insert and mark analyzed in one transaction - a single
+        # fsync for the whole batch instead of one per statement per game
+        with self.conn() as conn:
+            conn.executemany('DELETE FROM analysis WHERE game_id = ?', game_ids)
+            conn.executemany('''
+                INSERT INTO analysis (game_id, move_number, move, san_move, fen_before,
+                                    eval_before, eval_after, eval_change, error_type, player)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.executemany('UPDATE games SET analyzed = TRUE, analyzer_version = ? WHERE game_id = ?',
+                             [(analyzer_version, game_id) for game_id, _ in results])
+
+    def get_games_needing_analysis(self, game_ids: List[str], analyzer_version: int) -> set:
+        """
+        Filter game IDs down to those never analyzed or analyzed by an
+        older version of the analysis logic.
+
+        Args:
+            game_ids: Candidate game IDs
+            analyzer_version: Current analyzer version
+
+        Returns:
+            Set of game IDs that still need (re)analysis
+        """
+        if not game_ids:
+            return set()
+        with self.conn() as conn:
             cursor = conn.cursor()
-            
-            # Clear any existing analysis for this game
-            cursor.execute('DELETE FROM analysis WHERE game_id = ?', (game_id,))
-            
-            # Insert new analysis results
-            for error in errors:
-                cursor.execute('''
-                    INSERT INTO analysis (game_id, move_number, move, san_move, fen_before, 
-                                        eval_before, eval_after, eval_change, error_type, player)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    game_id,
-                    error.get('move_number', 0),
-                    error.get('move', ''),
-                    error.get('san_move', ''),
-                    error.get('fen_before', ''),
-                    error.get('eval_before', 0.0),
-                    error.get('eval_after', 0.0),
-                    error.get('eval_change', 0.0),
-                    error.get('error_type', ''),
-                    error.get('player', '')
-                ))
-            
-            # Mark game as analyzed
-            cursor.execute('UPDATE games SET analyzed = TRUE WHERE game_id = ?', (game_id,))
-            conn.commit()
+            placeholders = ','.join('?' * len(game_ids))
+            cursor.execute(f'''
+                SELECT game_id FROM games
+                WHERE game_id IN ({placeholders})
+                  AND (analyzed = FALSE OR COALESCE(analyzer_version, 0) < ?)
+            ''', list(game_ids) + [analyzer_version])
+            return {row[0] for row in cursor.fetchall()}
     
     def get_analysis(self, game_id: str) -> List[Dict[str, Any]]:
         """
@@ -173,7 +370,7 @@ class ChessDatabase:
         Returns:
             List of error dictionaries
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT move_number, move, san_move, fen_before, eval_before, eval_after, 
@@ -191,15 +388,61 @@ class ChessDatabase:
                     'move': row[1],
                     'san_move': row[2],
                     'fen_before': row[3],
-                    'eval_before': row[4],
-                    'eval_after': row[5],
-                    'eval_change': row[6],
+                    'eval_before': row[4] / 100.0,  # Stored as centipawns
+                    'eval_after': row[5] / 100.0,
+                    'eval_change': row[6] / 100.0,
                     'error_type': row[7],
                     'player': row[8]
                 })
             
             return errors
     
+    def get_analyses_bulk(self, game_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Retrieve analysis results for many games in two queries.
+
+        Args:
+            game_ids: Game IDs to look up
+
+        Returns:
+            Dictionary mapping each analyzed game ID to its error list
+            (empty list for analyzed games without errors)
+        """
+        if not game_ids:
+            return {}
+        with self.conn() as conn:
+            cursor = conn.cursor()
+            placeholders = ','.join('?' * len(game_ids))
+            cursor.execute(f'''
+                SELECT game_id FROM games
+                WHERE game_id IN ({placeholders}) AND analyzed = TRUE
+            ''', list(game_ids))
+            analyses = {row[0]: [] for row in cursor.fetchall()}
+            if not analyses:
+                return {}
+
+            placeholders = ','.join('?' * len(analyses))
+            cursor.execute(f'''
+                SELECT game_id, move_number, move, san_move, fen_before, eval_before,
+                       eval_after, eval_change, error_type, player
+                FROM analysis
+                WHERE game_id IN ({placeholders})
+                ORDER BY game_id, move_number
+            ''', list(analyses))
+            for row in cursor.fetchall():
+                analyses[row[0]].append({
+                    'move_number': row[1],
+                    'move': row[2],
+                    'san_move': row[3],
+                    'fen_before': row[4],
+                    'eval_before': row[5] / 100.0,  # Stored as centipawns
+                    'eval_after': row[6] / 100.0,
+                    'eval_change': row[7] / 100.0,
+                    'error_type': row[8],
+                    'player': row[9]
+                })
+            return analyses
+
     def get_unanalyzed_games(self, username: str, limit: int = None) -> List[Dict[str, Any]]:
         """
         Get unanalyzed games for a user.
@@ -211,25 +454,25 @@ class ChessDatabase:
         Returns:
             List of game dictionaries
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
+            # LIMIT is a bound parameter (SQLite treats -1 as unlimited) so
+            # the statement text - and its query plan - stays stable
             query = '''
                 SELECT game_id, pgn, white_player, black_player, result, date_played
-                FROM games 
+                FROM games
                 WHERE username = ? AND analyzed = FALSE
                 ORDER BY date_added DESC
+                LIMIT ?
             '''
-            if limit:
-                query += f' LIMIT {limit}'
-            
-            cursor.execute(query, (username,))
+            cursor.execute(query, (username, limit if limit else -1))
             results = cursor.fetchall()
             
             games = []
             for row in results:
                 games.append({
                     'game_id': row[0],
-                    'pgn': row[1],
+                    'pgn': self.decompress_pgn(row[1]),
                     'white_player': row[2],
                     'black_player': row[3],
                     'result': row[4],
@@ -248,26 +491,17 @@ class ChessDatabase:
         Returns:
             Dictionary with statistics
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self.conn() as conn:
             cursor = conn.cursor()
-            
-            # Total games
-            cursor.execute('SELECT COUNT(*) FROM games WHERE username = ?', (username,))
-            total_games = cursor.fetchone()[0]
-            
-            # Analyzed games
-            cursor.execute('SELECT COUNT(*) FROM games WHERE username = ? AND analyzed = TRUE', (username,))
-            analyzed_games = cursor.fetchone()[0]
-            
-            # Total errors
+
+            # Game counts in one scan - analyzed is 0/1 so SUM counts it
             cursor.execute('''
-                SELECT COUNT(*) FROM analysis a
-                JOIN games g ON a.game_id = g.game_id
-                WHERE g.username = ?
+                SELECT COUNT(*), COALESCE(SUM(analyzed), 0)
+                FROM games WHERE username = ?
             ''', (username,))
-            total_errors = cursor.fetchone()[0]
-            
-            # Error types
+            total_games, analyzed_games = cursor.fetchone()
+
+            # Error-type breakdown in one scan; the total is just its sum
             cursor.execute('''
                 SELECT error_type, COUNT(*) FROM analysis a
                 JOIN games g ON a.game_id = g.game_id
@@ -275,7 +509,8 @@ class ChessDatabase:
                 GROUP BY error_type
             ''', (username,))
             error_types = dict(cursor.fetchall())
-            
+            total_errors = sum(error_types.values())
+
             return {
                 'total_games': total_games,
                 'analyzed_games': analyzed_games,
@@ -290,14 +525,18 @@ class ChessDatabase:
         Args:
             days: Number of days to keep
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                DELETE FROM analysis 
-                WHERE date_analyzed < datetime('now', '-{} days')
-            '''.format(days))
+        conn = self.conn()
+        cutoff = f'-{int(days)} days'
+        # Delete in batches so each transaction (and its WAL checkpoint)
+        # stays small even on very large tables
+        while True:
+            cursor = conn.execute('''
+                DELETE FROM analysis WHERE rowid IN (
+                    SELECT rowid FROM analysis
+                    WHERE date_analyzed < datetime('now', ?)
+                    LIMIT 10000
+                )
+            ''', (cutoff,))
             conn.commit()
-    
-    def conn(self):
-        """Get a database connection context manager."""
-        return sqlite3.connect(self.db_path) 
\ No newline at end of file
+            if cursor.rowcount < 10000:
+                break 
\ No newline at end of file
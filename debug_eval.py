@@ -67,39 +67,40 @@ def debug_evaluation():
             is_white_turn = board.turn == chess.WHITE
             
             # Get evaluation before the move
-            info_before = engine.analyse(board, chess.engine.Limit(time=0.1))
+            info_before = engine.analyse(board, chess.engine.Limit(time=0.1), info=chess.engine.INFO_SCORE)
             eval_before = info_before.get('score', None)
             if eval_before is None:
                 eval_before_centipawns = 0
             else:
                 eval_before_centipawns = eval_before.white().score(mate_score=10000)
             
-            # Make the move
-            board.push(move)
-            
+            # Compute SAN and make the move in one step - san_and_push
+            # generates legal moves once for both, and the SAN comes from
+            # the position the move was played in (a plain board.san after
+            # push named the move against the wrong position)
+            try:
+                san_move = board.san_and_push(move)
+            except Exception:
+                board.push(move)
+                san_move = move.uci()
+
             # Get evaluation after the move
-            info_after = engine.analyse(board, chess.engine.Limit(time=0.1))
+            info_after = engine.analyse(board, chess.engine.Limit(time=0.1), info=chess.engine.INFO_SCORE)
             eval_after = info_after.get('score', None)
             if eval_after is None:
                 eval_after_centipawns = 0
             else:
                 eval_after_centipawns = eval_after.white().score(mate_score=10000)
             
-            # Calculate evaluation change
+            # Calculate evaluation change from the mover's perspective
+            # (the old double-negation here flipped Black's sign back)
             if is_white_turn:
                 eval_change = eval_after_centipawns - eval_before_centipawns
             else:
-                eval_change = -eval_after_centipawns - (-eval_before_centipawns)
-                eval_change = -eval_change
-            
+                eval_change = eval_before_centipawns - eval_after_centipawns
+
             eval_change_pawns = eval_change / 100.0
-            
-            # Get SAN notation
-            try:
-                san_move = board.san(move)
-            except:
-                san_move = move.uci()
-            
+
             print(f"Move {i+1:2d} ({'White' if is_white_turn else 'Black'}): {san_move}")
             print(f"  Eval before: {eval_before_centipawns/100.0:6.2f}  Eval after: {eval_after_centipawns/100.0:6.2f}")
             print(f"  Change: {eval_change_pawns:6.2f} pawns")
@@ -9,8 +9,58 @@ from io import StringIO
 from fetch import ChessComAPI
 from utils import load_environment
 
-def debug_san_parsing():
-    """Debug SAN parsing errors."""
+class DebugSanVisitor(chess.pgn.BaseVisitor):
+    """
+    Check SAN generation move by move while the PGN is being parsed.
+
+    Running inside the parser's single pass avoids materializing the full
+    Game node tree and then replaying the mainline on a second board.
+    """
+
+    def __init__(self, max_moves: int = 20, verbose: bool = False):
+        self.max_moves = max_moves
+        self.verbose = verbose
+        self.i = 0
+
+    def visit_move(self, board, move):
+        # board arrives already positioned before the move
+        if self.i >= self.max_moves:
+            return
+        is_white_turn = board.turn == chess.WHITE
+
+        print(f"Move {self.i+1:2d} ({'White' if is_white_turn else 'Black'}): {move.uci()}")
+        # board.fen() serializes the whole position; only build it when
+        # it will actually be shown
+        if self.verbose:
+            print(f"  Position: {board.fen()}")
+
+        # Try to get SAN notation
+        try:
+            san_move = board.san(move)
+            print(f"  SAN: {san_move} ✅")
+        except Exception as e:
+            print(f"  SAN: ERROR - {e}")
+            if not self.verbose:
+                print(f"  Position: {board.fen()}")
+            print(f"  Move UCI: {move.uci()}")
+            print(f"  From square: {chess.square_name(move.from_square)}")
+            print(f"  To square: {chess.square_name(move.to_square)}")
+            if move.promotion:
+                print(f"  Promotion: {move.promotion}")
+
+        print()
+        self.i += 1
+
+    def result(self):
+        return self.i
+
+def debug_san_parsing(verbose: bool = False):
+    """
+    Debug SAN parsing errors.
+
+    Args:
+        verbose: Print the FEN for every move, not just failing ones
+    """
     print("🔍 Debugging SAN Parsing Errors")
     print("=" * 50)
     
@@ -45,41 +95,14 @@ def debug_san_parsing():
     print(f"Analyzing game: {game.get('white', {}).get('username', 'Unknown')} vs {game.get('black', {}).get('username', 'Unknown')}")
     
     try:
-        # Parse the game
-        pgn_io = StringIO(pgn)
-        game_obj = chess.pgn.read_game(pgn_io)
-        board = game_obj.board()
-        
         print("\nAnalyzing moves for SAN parsing issues:")
         print("-" * 80)
-        
-        for i, move in enumerate(game_obj.mainline_moves()):
-            if i >= 20:  # Check first 20 moves
-                break
-                
-            # Get position before the move
-            fen_before = board.fen()
-            is_white_turn = board.turn == chess.WHITE
-            
-            print(f"Move {i+1:2d} ({'White' if is_white_turn else 'Black'}): {move.uci()}")
-            print(f"  Position: {fen_before}")
-            
-            # Try to get SAN notation
-            try:
-                san_move = board.san(move)
-                print(f"  SAN: {san_move} ✅")
-            except Exception as e:
-                print(f"  SAN: ERROR - {e}")
-                print(f"  Move UCI: {move.uci()}")
-                print(f"  From square: {chess.square_name(move.from_square)}")
-                print(f"  To square: {chess.square_name(move.to_square)}")
-                if move.promotion:
-                    print(f"  Promotion: {move.promotion}")
-            
-            # Make the move
-            board.push(move)
-            print()
-    
+
+        # Parse and check in one pass - the visitor sees each move as it
+        # is read, so no Game tree is built and no second board replays it
+        pgn_io = StringIO(pgn)
+        chess.pgn.read_game(pgn_io, Visitor=lambda: DebugSanVisitor(verbose=verbose))
+
     except Exception as e:
         print(f"Error during analysis: {e}")
 
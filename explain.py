@@ -2,37 +2,110 @@
 GPT-4.1 integration for explaining chess mistakes and providing learning insights.
 """
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from typing import Dict, Any, Optional, List
 from utils import get_openai_api_key
+import asyncio
+import atexit
+import hashlib
+import json
 import os
+import sqlite3
 from datetime import datetime
 import re
 
+# System prompt shared by the sync and async batch paths; JSON mode makes
+# the model return a machine-parseable payload instead of freeform text
+_BATCH_SYSTEM_PROMPT = (
+    "You are a chess coach. Provide brief, educational explanations for chess mistakes. "
+    'Return JSON of the form {"explanations": [{"id": 1, "text": "..."}]} '
+    "with one entry per error, where id is the error number (1, 2, 3, etc.)."
+)
+
+# Section-header cues for blunder explanations, matched in one pass per
+# line instead of six substring scans over a lowercased copy
+_SECTION_RE = re.compile(
+    r"(?P<why_blunder>blunder|wrong)"
+    r"|(?P<correct_plan>correct|best|should)"
+    r"|(?P<lesson_learned>lesson|principle|remember)",
+    re.IGNORECASE
+)
+
 class ChessExplainer:
     """Handles GPT-4.1 explanations for chess mistakes."""
     
-    def __init__(self):
+    def __init__(self, cache_path: str = "explanations_cache.db"):
         """Initialize the explainer with OpenAI API key and gpt-4.1 model."""
         try:
             api_key = get_openai_api_key()
             self.client = OpenAI(api_key=api_key)
+            self.async_client = AsyncOpenAI(api_key=api_key)
             self.model = "gpt-4.1"
             self.total_tokens = 0
             self.total_cost = 0.0
+            # On-disk cache of explanations: the same mistake in the same
+            # position costs tokens only once across runs
+            self._cache = sqlite3.connect(cache_path, check_same_thread=False)
+            self._cache.execute('''
+                CREATE TABLE IF NOT EXISTS explanation_cache (
+                    key TEXT PRIMARY KEY,
+                    explanation TEXT NOT NULL,
+                    created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self._cache.commit()
             # Set up per-run log file
             log_dir = "logs"
             if not os.path.exists(log_dir):
                 os.makedirs(log_dir)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             self.log_path = os.path.join(log_dir, f"gpt_api_{timestamp}.log")
+            # Opened once and kept for the run; reopening per message costs
+            # a syscall round-trip for every log line
+            self._log_file = open(self.log_path, "a", encoding="utf-8", buffering=65536)
+            atexit.register(self._log_file.close)
         except ValueError as e:
             print(f"Error initializing OpenAI: {e}")
             raise
+
+    @staticmethod
+    def _explanation_key(error: Dict[str, Any]) -> str:
+        """Cache key for one error: type, rounded eval swing and board layout."""
+        board = error.get('fen_before', '').split(' ')[0]
+        raw = f"{error.get('error_type')}|{round(error.get('eval_change', 0))}|{board}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    def _partition_cached(self, errors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fill explanations from the cache; return the errors still needing one."""
+        keys = [self._explanation_key(error) for error in errors]
+        placeholders = ','.join('?' * len(keys))
+        rows = self._cache.execute(
+            f'SELECT key, explanation FROM explanation_cache WHERE key IN ({placeholders})',
+            keys).fetchall()
+        cached = dict(rows)
+        uncached = []
+        for error, key in zip(errors, keys):
+            if key in cached:
+                error['explanation'] = cached[key]
+            else:
+                uncached.append(error)
+        if len(errors) - len(uncached):
+            print(f"💾 {len(errors) - len(uncached)} explanations served from cache")
+        return uncached
+
+    def _save_explanations(self, errors: List[Dict[str, Any]]):
+        """Persist freshly generated explanations to the cache."""
+        rows = [(self._explanation_key(error), error['explanation'])
+                for error in errors
+                if error.get('explanation') and error['explanation'] != "No explanation available."]
+        if rows:
+            self._cache.executemany(
+                'INSERT OR REPLACE INTO explanation_cache (key, explanation) VALUES (?, ?)',
+                rows)
+            self._cache.commit()
     
     def _log(self, message: str):
-        with open(self.log_path, "a", encoding="utf-8") as f:
-            f.write(message + "\n")
+        self._log_file.write(message + "\n")
     
     def estimate_cost(self, num_errors: int) -> float:
         """
@@ -64,12 +137,23 @@ class ChessExplainer:
         """
         if not errors:
             return []
-        
+
         # Limit the number of errors to explain
         errors_to_explain = errors[:max_errors]
-        
+
+        # Serve repeats from the on-disk cache; only new errors hit the API
+        uncached = self._partition_cached(errors_to_explain)
+        if not uncached:
+            return errors_to_explain
+
+        # Larger batches go over the async client so the chunks are in
+        # flight concurrently instead of one request after another
+        if len(uncached) > 15:
+            asyncio.run(self.explain_errors_batch_async(uncached))
+            return errors_to_explain
+
         # Log the batch prompt
-        batch_prompt = self._create_batch_prompt(errors_to_explain)
+        batch_prompt = self._create_batch_prompt(uncached)
         print("\n--- GPT-4.1 BATCH PROMPT ---\n")
         print(batch_prompt)
         print("\n--- END BATCH PROMPT ---\n")
@@ -81,17 +165,18 @@ class ChessExplainer:
                 messages=[
                     {
                         "role": "system",
-                        "content": "You are a chess coach. Provide brief, educational explanations for chess mistakes. Format each explanation as 'ERROR_X: [explanation]' where X is the error number (1, 2, 3, etc.)."
+                        "content": _BATCH_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
                         "content": batch_prompt
                     }
                 ],
+                response_format={"type": "json_object"},
                 max_tokens=1000,
                 temperature=0.7
             )
-            
+
             explanation_text = response.choices[0].message.content.strip()
             print("\n--- RAW GPT-4.1 BATCH RESPONSE ---\n")
             print(explanation_text)
@@ -99,66 +184,127 @@ class ChessExplainer:
             self._log("\n--- RAW GPT-4.1 BATCH RESPONSE ---\n" + explanation_text + "\n--- END RAW RESPONSE ---\n")
             
             # Parse the batch response
-            explanations = self._parse_batch_explanations(explanation_text, len(errors_to_explain))
+            explanations = self._parse_batch_explanations(explanation_text, len(uncached))
             print("\n--- PARSED EXPLANATIONS DICT ---\n")
             print(explanations)
             print("\n--- END PARSED EXPLANATIONS ---\n")
             self._log("\n--- PARSED EXPLANATIONS DICT ---\n" + str(explanations) + "\n--- END PARSED EXPLANATIONS ---\n")
-            
+
             # Add explanations to errors
-            for i, error in enumerate(errors_to_explain):
+            for i, error in enumerate(uncached):
                 error['explanation'] = explanations.get(i+1, "No explanation available.")
-            
+            self._save_explanations(uncached)
+
             # Update token usage
             self.total_tokens += response.usage.total_tokens
             self.total_cost += (response.usage.prompt_tokens * 2.00 / 1_000_000) + (response.usage.completion_tokens * 8.00 / 1_000_000)
-            
-            print(f"✅ Explained {len(errors_to_explain)} errors. Total cost so far: ${self.total_cost:.3f}")
-            
+
+            print(f"✅ Explained {len(uncached)} errors. Total cost so far: ${self.total_cost:.3f}")
+
             return errors_to_explain
-            
+
         except Exception as e:
             print(f"Error generating batch explanations: {e}")
             return errors
-    
+
+    async def explain_errors_batch_async(self, errors: List[Dict[str, Any]],
+                                         chunk_size: int = 15) -> List[Dict[str, Any]]:
+        """
+        Explain errors in chunks issued concurrently over the async client.
+
+        Args:
+            errors: List of error dictionaries
+            chunk_size: Errors per API call
+
+        Returns:
+            List of errors with explanations added
+        """
+        if not errors:
+            return []
+
+        uncached = self._partition_cached(errors)
+        if not uncached:
+            return errors
+
+        chunks = [uncached[i:i + chunk_size] for i in range(0, len(uncached), chunk_size)]
+        # Cap in-flight requests to stay under per-key rate limits
+        semaphore = asyncio.Semaphore(4)
+        results = await asyncio.gather(
+            *(self._explain_chunk_async(chunk, semaphore) for chunk in chunks),
+            return_exceptions=True
+        )
+
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                print(f"Error generating batch explanations: {result}")
+
+        print(f"✅ Explained {len(uncached)} errors in {len(chunks)} concurrent batches. "
+              f"Total cost so far: ${self.total_cost:.3f}")
+        return errors
+
+    async def _explain_chunk_async(self, errors: List[Dict[str, Any]],
+                                   semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        """Explain one chunk of errors on the async client."""
+        batch_prompt = self._create_batch_prompt(errors)
+        self._log("\n--- GPT-4.1 BATCH PROMPT ---\n" + batch_prompt + "\n--- END BATCH PROMPT ---\n")
+
+        async with semaphore:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": _BATCH_SYSTEM_PROMPT
+                    },
+                    {
+                        "role": "user",
+                        "content": batch_prompt
+                    }
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=1000,
+                temperature=0.7
+            )
+
+        explanation_text = response.choices[0].message.content.strip()
+        self._log("\n--- RAW GPT-4.1 BATCH RESPONSE ---\n" + explanation_text + "\n--- END RAW RESPONSE ---\n")
+
+        explanations = self._parse_batch_explanations(explanation_text, len(errors))
+        for i, error in enumerate(errors):
+            error['explanation'] = explanations.get(i+1, "No explanation available.")
+        self._save_explanations(errors)
+
+        self.total_tokens += response.usage.total_tokens
+        self.total_cost += (response.usage.prompt_tokens * 2.00 / 1_000_000) + (response.usage.completion_tokens * 8.00 / 1_000_000)
+        return errors
+
     def _create_batch_prompt(self, errors: List[Dict[str, Any]]) -> str:
         """Create a batch prompt for multiple errors."""
-        prompt = "Explain these chess mistakes briefly:\n\n"
-        
+        # Collect the pieces and join once rather than rebuilding the
+        # string with += for every line
+        parts = ["Explain these chess mistakes briefly:\n\n"]
+
         for i, error in enumerate(errors, 1):
-            prompt += f"ERROR_{i}:\n"
-            prompt += f"Move: {error['san_move']}\n"
-            prompt += f"Type: {error['error_type']}\n"
-            prompt += f"Eval change: {error['eval_change']:.2f} pawns\n"
-            prompt += f"Position: {error['fen_before']}\n\n"
-        
-        prompt += "Provide brief explanations (1-2 sentences each) focusing on why the move was problematic and what would be better."
-        return prompt
+            parts.append(
+                f"ERROR_{i}:\n"
+                f"Move: {error['san_move']}\n"
+                f"Type: {error['error_type']}\n"
+                f"Eval change: {error['eval_change']:.2f} pawns\n"
+                f"Position: {error['fen_before']}\n\n"
+            )
+
+        parts.append("Provide brief explanations (1-2 sentences each) focusing on why the move was problematic and what would be better.")
+        return ''.join(parts)
     
     def _parse_batch_explanations(self, response: str, num_errors: int) -> Dict[int, str]:
-        """Parse batch response into individual explanations."""
-        explanations = {}
-        current_error = None
-        current_explanation = []
-        lines = response.split('\n')
-        for line in lines:
-            match = re.match(r"ERROR_(\d+):\s*(.*)", line)
-            if match:
-                # Save previous explanation
-                if current_error is not None and current_explanation:
-                    explanations[current_error] = ' '.join(current_explanation).strip()
-                # Start new error
-                current_error = int(match.group(1))
-                explanation_text = match.group(2).strip()
-                current_explanation = [explanation_text] if explanation_text else []
-            elif current_error is not None:
-                # Continuation of previous explanation
-                if line.strip():
-                    current_explanation.append(line.strip())
-        # Save last explanation
-        if current_error is not None and current_explanation:
-            explanations[current_error] = ' '.join(current_explanation).strip()
-        return explanations
+        """Parse the JSON-mode batch response into individual explanations."""
+        try:
+            data = json.loads(response)
+            return {int(entry['id']): entry['text'].strip()
+                    for entry in data.get('explanations', [])}
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            print(f"Malformed batch explanation response: {e}")
+            return {}
 
     def explain_error(self, san_move: str, fen_before: str, eval_change: float, error_type: str) -> Optional[str]:
         """
@@ -173,6 +319,15 @@ class ChessExplainer:
         Returns:
             Explanation string or None if error
         """
+        # Recurring (position, move, model) signatures skip the API entirely
+        signature = hashlib.blake2b(
+            f"{fen_before}|{san_move}|{round(eval_change, 2)}|{error_type}|{self.model}".encode(),
+            digest_size=16).hexdigest()
+        row = self._cache.execute(
+            'SELECT explanation FROM explanation_cache WHERE key = ?', (signature,)).fetchone()
+        if row:
+            return row[0]
+
         try:
             # Log the prompt
             prompt = self._create_error_prompt(san_move, fen_before, eval_change, error_type)
@@ -207,9 +362,13 @@ class ChessExplainer:
             # Update token usage
             self.total_tokens += response.usage.total_tokens
             self.total_cost += (response.usage.prompt_tokens * 2.00 / 1_000_000) + (response.usage.completion_tokens * 8.00 / 1_000_000)
-            
+
+            self._cache.execute(
+                'INSERT OR REPLACE INTO explanation_cache (key, explanation) VALUES (?, ?)',
+                (signature, explanation))
+            self._cache.commit()
             return explanation
-            
+
         except Exception as e:
             print(f"Error generating explanation: {e}")
             return f"Unable to generate explanation for this {error_type.lower()}."
@@ -325,37 +484,32 @@ Keep explanations clear and educational, suitable for intermediate players.
             Dictionary with parsed sections
         """
         # Simple parsing - look for common section headers
-        sections = {
-            'why_blunder': '',
-            'correct_plan': '',
-            'lesson_learned': ''
+        parts = {
+            'why_blunder': [],
+            'correct_plan': [],
+            'lesson_learned': []
         }
-        
-        lines = explanation.split('\n')
+
         current_section = None
-        
-        for line in lines:
+
+        for line in explanation.split('\n'):
             line = line.strip()
             if not line:
                 continue
-                
+
             # Detect section headers
-            if 'blunder' in line.lower() or 'wrong' in line.lower():
-                current_section = 'why_blunder'
-            elif 'correct' in line.lower() or 'best' in line.lower() or 'should' in line.lower():
-                current_section = 'correct_plan'
-            elif 'lesson' in line.lower() or 'principle' in line.lower() or 'remember' in line.lower():
-                current_section = 'lesson_learned'
-            elif current_section and line:
-                sections[current_section] += line + ' '
-        
-        # Clean up sections
-        for key in sections:
-            sections[key] = sections[key].strip()
-            if not sections[key]:
-                sections[key] = "No specific explanation provided for this section."
-        
-        return sections
+            match = _SECTION_RE.search(line)
+            if match:
+                current_section = match.lastgroup
+            elif current_section:
+                parts[current_section].append(line)
+
+        # Join accumulated lines; O(n) instead of repeated string concatenation
+        return {
+            key: ' '.join(lines) if lines
+            else "No specific explanation provided for this section."
+            for key, lines in parts.items()
+        }
     
     def get_improvement_suggestions(self, game_summary: Dict[str, Any]) -> Optional[str]:
         """
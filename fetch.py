@@ -3,19 +3,173 @@ Chess.com API integration for fetching user games.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import heapq
+import orjson
+import sqlite3
+import threading
 import time
+import zlib
 
 class ChessComAPI:
     """Handles interactions with the Chess.com API."""
-    
+
     BASE_URL = "https://api.chess.com/pub"
-    
-    def __init__(self):
+
+    def __init__(self, cache_path: str = "chesscom_cache.db"):
         self.session = requests.Session()
+        # Ask for JSON and compressed bodies explicitly - archives gzip
+        # roughly 10x smaller, and requests decompresses transparently
         self.session.headers.update({
-            'User-Agent': 'Chess-Insight-Analyzer/1.0'
+            'User-Agent': 'Chess-Insight-Analyzer/1.0',
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
         })
+        # Pooled connections for parallel archive fetches, with backoff on
+        # rate limits instead of hand-rolled sleeps
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=4,
+            max_retries=Retry(total=5, backoff_factor=0.5,
+                              status_forcelist=[429, 502, 503],
+                              respect_retry_after_header=True)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # On-disk cache for monthly archives: closed months are immutable on
+        # Chess.com so they're served from disk forever; the current month is
+        # revalidated with conditional GETs
+        self._cache = sqlite3.connect(cache_path, check_same_thread=False)
+        self._cache_lock = threading.Lock()
+        self._cache.execute('''
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                fetched TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._cache.commit()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        GET a URL over the pooled session.
+
+        Single entry point for callers outside this class, so keep-alive,
+        the User-Agent header and retry/backoff all live in one place.
+
+        Args:
+            url: URL to fetch
+            **kwargs: Passed through to requests.Session.get
+
+        Returns:
+            The HTTP response
+        """
+        return self.session.get(url, **kwargs)
+
+    @staticmethod
+    def _archive_month(archive_url: str) -> Optional[tuple]:
+        """Extract (year, month) from an archive URL, or None."""
+        parts = archive_url.rstrip('/').split('/')
+        try:
+            return int(parts[-2]), int(parts[-1])
+        except (ValueError, IndexError):
+            return None
+
+    @classmethod
+    def _is_closed_month(cls, archive_url: str) -> bool:
+        """Check whether an archive URL refers to a month that has ended."""
+        month = cls._archive_month(archive_url)
+        if month is None:
+            return False
+        now = datetime.utcnow()
+        return month < (now.year, now.month)
+
+    @classmethod
+    def _is_immutable_copy(cls, archive_url: str, fetched) -> bool:
+        """
+        Check whether a cached row can skip revalidation forever.
+
+        A closed month is only immutable if the body was fetched after the
+        month ended - a snapshot taken mid-month is missing the games played
+        before the rollover and must be revalidated once more.
+
+        Args:
+            archive_url: Monthly archive URL
+            fetched: The row's fetched timestamp (UTC 'YYYY-MM-DD HH:MM:SS')
+
+        Returns:
+            True when the cached body is the complete, final month
+        """
+        month = cls._archive_month(archive_url)
+        if month is None or not fetched:
+            return False
+        year, mon = month
+        now = datetime.utcnow()
+        if (year, mon) >= (now.year, now.month):
+            return False
+        next_year, next_month = (year + 1, 1) if mon == 12 else (year, mon + 1)
+        # Both sides are ISO-formatted UTC, so string comparison orders
+        # correctly against the first instant of the following month
+        return str(fetched) >= f"{next_year:04d}-{next_month:02d}-01 00:00:00"
+
+    def get_archive(self, archive_url: str) -> Dict[str, Any]:
+        """
+        Fetch a monthly archive, serving closed months whose cached copy
+        postdates the month end straight from disk and revalidating
+        everything else with If-None-Match/If-Modified-Since.
+
+        Args:
+            archive_url: Monthly archive URL
+
+        Returns:
+            Decoded archive JSON
+
+        Raises:
+            requests.RequestException on network errors
+        """
+        with self._cache_lock:
+            row = self._cache.execute(
+                'SELECT etag, last_modified, body, fetched FROM http_cache WHERE url = ?',
+                (archive_url,)).fetchone()
+
+        if row and self._is_immutable_copy(archive_url, row[3]):
+            return orjson.loads(zlib.decompress(row[2]))
+
+        headers = {}
+        if row:
+            if row[0]:
+                headers['If-None-Match'] = row[0]
+            if row[1]:
+                headers['If-Modified-Since'] = row[1]
+
+        response = self.session.get(archive_url, headers=headers)
+        if response.status_code == 304 and row:
+            # The body is confirmed current; refresh the fetched stamp so a
+            # now-closed month takes the no-network fast path next time
+            with self._cache_lock:
+                self._cache.execute(
+                    'UPDATE http_cache SET fetched = CURRENT_TIMESTAMP WHERE url = ?',
+                    (archive_url,))
+                self._cache.commit()
+            return orjson.loads(zlib.decompress(row[2]))
+        response.raise_for_status()
+
+        with self._cache_lock:
+            self._cache.execute(
+                'INSERT OR REPLACE INTO http_cache (url, etag, last_modified, body) VALUES (?, ?, ?, ?)',
+                (archive_url, response.headers.get('ETag'),
+                 response.headers.get('Last-Modified'),
+                 zlib.compress(response.content, 6)))
+            self._cache.commit()
+        # orjson decodes the multi-MB archive bodies ~3x faster than the
+        # stdlib parser behind response.json()
+        return orjson.loads(response.content)
     
     def get_user_games(self, username: str, count: int = 5) -> List[Dict[str, Any]]:
         """
@@ -41,31 +195,37 @@ class ChessComAPI:
                 print(f"No games found for user {username}")
                 return []
             
-            # Get games from the most recent archives
+            # Get games from the most recent archives, fetched in parallel -
+            # this is network-bound, so wall time is max(latency) not sum
             all_games = []
-            for archive_url in archives[-3:]:  # Last 3 months
-                try:
-                    games_response = self.session.get(archive_url)
-                    games_response.raise_for_status()
-                    games_data = games_response.json()
-                    games = games_data.get('games', [])
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                for games in executor.map(self._fetch_archive_games, archives[-3:]):  # Last 3 months
                     all_games.extend(games)
-                    
-                    # Rate limiting
-                    time.sleep(0.1)
-                    
-                except requests.RequestException as e:
-                    print(f"Error fetching games from {archive_url}: {e}")
-                    continue
-            
-            # Sort by date and take the most recent
-            all_games.sort(key=lambda x: x.get('end_time', 0), reverse=True)
-            return all_games[:count]
+
+            # Take the most recent games without sorting the whole list -
+            # count is tiny compared to three months of games
+            return heapq.nlargest(count, all_games, key=lambda x: x.get('end_time', 0))
             
         except requests.RequestException as e:
             print(f"Error fetching games for {username}: {e}")
             return []
     
+    def _fetch_archive_games(self, archive_url: str) -> List[Dict[str, Any]]:
+        """
+        Fetch the games from a single monthly archive.
+
+        Args:
+            archive_url: Monthly archive URL
+
+        Returns:
+            List of game data dictionaries (empty on error)
+        """
+        try:
+            return self.get_archive(archive_url).get('games', [])
+        except requests.RequestException as e:
+            print(f"Error fetching games from {archive_url}: {e}")
+            return []
+
     def get_game_pgn(self, game_data: Dict[str, Any]) -> Optional[str]:
         """
         Extract PGN from game data.
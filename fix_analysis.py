@@ -4,77 +4,153 @@ Fix the analysis by clearing the database and re-analyzing with proper color det
 """
 
 from database import ChessDatabase
-from analyze import ChessAnalyzer
+from analyze import ChessAnalyzer, ANALYZER_VERSION
 from fetch import ChessComAPI
 from utils import load_environment, load_username
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import argparse
+import atexit
+import itertools
+import os
 import requests
 import time
 
+try:
+    # Optional: streams archive JSON one game at a time instead of
+    # materializing the whole month before filtering
+    import ijson
+except ImportError:
+    ijson = None
+
+# Errors a streamed month can raise mid-iteration: network failures, plus
+# parse errors when ijson is doing the incremental decoding
+_STREAM_ERRORS = ((requests.RequestException, ijson.JSONError)
+                  if ijson is not None else (requests.RequestException,))
+
+# Chess.com result codes that count as a loss; frozenset membership is a
+# hash lookup instead of a list scan per game
+LOST_RESULTS = frozenset([
+    'checkmated', 'timeout', 'resigned', 'lose', 'abandoned',
+    'timeout vs computer',
+])
+
+# One analyzer (and Stockfish engine) per pool worker, created once by the
+# initializer and reused for every game the worker picks up
+_worker_analyzer = None
+
+def _init_worker():
+    """Create the persistent single-engine analyzer for a pool worker process."""
+    global _worker_analyzer
+    # The process pool already provides the N-way parallelism, so each
+    # worker runs exactly one engine; the default pool_size (cpu_count)
+    # would spawn cpu_count engines per worker and thrash the machine.
+    # Each worker opens its own database connection (safe under WAL) so
+    # the persistent FEN->eval cache works inside the pool too.
+    _worker_analyzer = ChessAnalyzer(db=ChessDatabase(), pool_size=1)
+    atexit.register(_worker_analyzer.close_engine)
+
 def analyze_game_worker_fixed(args):
-    """Fixed version that properly tracks player color."""
-    pgn, username, game_id, db = args
-    analyzer = ChessAnalyzer()
-    analyzer.initialize_engine()
-    try:
-        errors = analyzer.analyze_game(pgn, username)
-        # Save analysis to database
-        if db:
-            db.save_analysis(game_id, errors)
-        return errors
-    finally:
-        analyzer.close_engine()
+    """Analyze one game on the worker's persistent engine."""
+    pgn, username, game_id = args
+    return game_id, _worker_analyzer.analyze_game(pgn, username)
 
 def get_last_n_lost_games(api, username, n=100):
     """Fetch the last n games the user lost, working backwards through monthly archives."""
     lost_games = []
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; ChessAnalyzer/1.0)"}
-    # Get list of archive URLs
+    username_lower = username.lower()
+    # Get list of archive URLs over the API's pooled session (connection
+    # reuse + retry/backoff come from ChessComAPI)
     archives_url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    resp = requests.get(archives_url, headers=headers)
+    resp = api.get(archives_url)
     if resp.status_code != 200:
         print(f"Failed to fetch archives for {username} (status {resp.status_code})")
         print(f"Response: {resp.text}")
         return []
     archive_urls = resp.json().get('archives', [])[::-1]  # Most recent first
     print(f"Found {len(archive_urls)} monthly archives.")
-    
-    for idx, archive_url in enumerate(archive_urls):
-        month_resp = requests.get(archive_url, headers=headers)
-        if month_resp.status_code != 200:
-            print(f"Failed to fetch archive {archive_url} (status {month_resp.status_code})")
-            print(f"Response: {month_resp.text}")
-            continue
-        month_games = month_resp.json().get('games', [])
-        print(f"Archive {archive_url}: {len(month_games)} games found.")
-        
+
+    def stream_month(archive_url):
+        """Yield games one at a time from a streamed, incrementally parsed response."""
+        resp = api.session.get(archive_url, stream=True)
+        resp.raise_for_status()
+        # The session asks for gzip and resp.raw is the undecoded wire
+        # stream; tell urllib3 to decompress it or ijson chokes on the
+        # gzip magic bytes
+        resp.raw.decode_content = True
+        try:
+            yield from ijson.items(resp.raw, 'games.item')
+        finally:
+            resp.close()
+
+    def fetch_month(archive_url):
+        # The open month can't come from the immutable disk cache; stream it
+        # so an early quota break skips parsing the rest of the response
+        if ijson is not None and not api._is_closed_month(archive_url):
+            return stream_month(archive_url)
+        try:
+            # Closed months come straight from the on-disk cache
+            return api.get_archive(archive_url).get('games', [])
+        except requests.RequestException as e:
+            print(f"Failed to fetch archive {archive_url}: {e}")
+            return None
+
+    def collect_from_month(archive_url, month_games):
+        """Append the user's losses from one month; True when the quota is met."""
+        # month_games may be a lazy iterator, so games are counted as they
+        # stream past rather than with len()
+        seen = 0
         # Process games in chronological order (oldest first) to get the most recent losses
         for game in month_games:
-            white = game.get('white', {}).get('username', '').lower()
-            black = game.get('black', {}).get('username', '').lower()
-            white_result = game.get('white', {}).get('result', '').lower()
-            black_result = game.get('black', {}).get('result', '').lower()
-            user_is_white = username.lower() == white
-            user_is_black = username.lower() == black
-            
-            if user_is_white and white_result in ['checkmated', 'timeout', 'resigned', 'lose', 'abandoned', 'timeout vs computer']:
+            seen += 1
+            white = game.get('white', {})
+            black = game.get('black', {})
+            white_result = white.get('result', '').lower()
+            black_result = black.get('result', '').lower()
+            user_is_white = username_lower == white.get('username', '').lower()
+            user_is_black = username_lower == black.get('username', '').lower()
+
+            if user_is_white and white_result in LOST_RESULTS:
                 lost_games.append(game)
                 print(f"Found lost game as White: {white_result}")
-            elif user_is_black and black_result in ['checkmated', 'timeout', 'resigned', 'lose', 'abandoned', 'timeout vs computer']:
+            elif user_is_black and black_result in LOST_RESULTS:
                 lost_games.append(game)
                 print(f"Found lost game as Black: {black_result}")
-            
+
             if len(lost_games) >= n:
                 print(f"✅ Collected {len(lost_games)} lost games. Stopping search.")
-                return lost_games[:n]
-    
+                return True
+        print(f"Archive {archive_url}: {seen} games scanned.")
+        return False
+
+    # Fetch a few months at a time in parallel; batching (rather than
+    # submitting everything) keeps the early break from downloading the
+    # whole history when the quota is met in recent months
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for batch_start in range(0, len(archive_urls), 4):
+            batch_urls = archive_urls[batch_start:batch_start + 4]
+            for archive_url, month_games in zip(batch_urls, executor.map(fetch_month, batch_urls)):
+                if month_games is None:
+                    continue
+                try:
+                    if collect_from_month(archive_url, month_games):
+                        return lost_games[:n]
+                except _STREAM_ERRORS as e:
+                    # Streamed months surface network and parse errors
+                    # mid-iteration
+                    print(f"Failed to fetch archive {archive_url}: {e}")
+
     print(f"Collected {len(lost_games)} lost games in total.")
     return lost_games
 
 def main():
+    parser = argparse.ArgumentParser(description="Re-analyze lost games with fixed color detection")
+    parser.add_argument('--force', action='store_true',
+                        help='Clear all analysis data and re-analyze every game')
+    args = parser.parse_args()
+
     print("🔧 Fixing Chess Analysis Database")
     print("=" * 50)
-    
+
     load_environment()
     username = load_username()
     if not username:
@@ -87,15 +163,16 @@ def main():
     db = ChessDatabase()
     print(f"\n📊 Database: {db.db_path}")
     
-    # Clear all existing analysis data
-    print("\n🗑️  Clearing existing analysis data...")
-    with db.conn() as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM analysis')
-        cursor.execute('UPDATE games SET analyzed = FALSE')
-        conn.commit()
-    print("✅ Database cleared")
-    
+    if args.force:
+        # Clear all existing analysis data and start from scratch
+        print("\n🗑️  Clearing existing analysis data...")
+        with db.conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM analysis')
+            cursor.execute('UPDATE games SET analyzed = FALSE')
+            conn.commit()
+        print("✅ Database cleared")
+
     # Fetch games again
     print(f"\n🔍 Fetching last 100 lost games for: {username}")
     api = ChessComAPI()
@@ -106,45 +183,90 @@ def main():
         print("No lost games found!")
         return
     
-    # Add games to database
-    games_to_analyze = []
-    for game in lost_games:
-        if game.get('pgn'):
-            game_id = db.add_game(game, username)
-            game['game_id'] = game_id
-            games_to_analyze.append(game)
-            print(f"🔄 Game {game_id[:8]}... queued for analysis")
-    
+    # Add games to database in one transaction. game_id hashes the PGN,
+    # so byte-identical duplicates share an ID and only the first is queued
+    candidates = []
+    seen_ids = set()
+    games_with_pgn = [game for game in lost_games if game.get('pgn')]
+    for game, game_id in zip(games_with_pgn, db.add_games(games_with_pgn, username)):
+        game['game_id'] = game_id
+        if game_id not in seen_ids:
+            seen_ids.add(game_id)
+            candidates.append(game)
+
+    # Only reanalyze games never analyzed, or analyzed by an older version
+    # of the logic - reruns skip work already done
+    if args.force:
+        games_to_analyze = candidates
+    else:
+        needed = db.get_games_needing_analysis(
+            [game['game_id'] for game in candidates], ANALYZER_VERSION)
+        games_to_analyze = [game for game in candidates if game['game_id'] in needed]
+        skipped = len(candidates) - len(games_to_analyze)
+        if skipped:
+            print(f"⏭️  Skipping {skipped} games already analyzed by analyzer v{ANALYZER_VERSION}")
+
+    for game in games_to_analyze:
+        print(f"🔄 Game {game['game_id'][:8]}... queued for analysis")
+
+    if not games_to_analyze:
+        print("\n✅ Everything is already up to date!")
+        return
+
     # Analyze all games with fixed logic
     print(f"\n🔄 Re-analyzing {len(games_to_analyze)} games with fixed color detection...")
     
-    # Prepare arguments for parallel analysis
-    game_args = [(game.get('pgn'), username, game.get('game_id'), db) for game in games_to_analyze]
-    
+    # Prepare arguments for parallel analysis. The db handle stays in the
+    # parent - workers only analyze, the parent persists results.
+    game_args = [(game.get('pgn'), username, game.get('game_id')) for game in games_to_analyze]
+
     all_errors = []
-    with ProcessPoolExecutor() as executor:
-        futures = [executor.submit(analyze_game_worker_fixed, arg) for arg in game_args]
-        for i, future in enumerate(as_completed(futures), 1):
-            errors = future.result()
-            all_errors.extend(errors)
-            print(f"Analyzed game {i}/{len(game_args)}: {len(errors)} errors found")
+    results = []
+    max_workers = os.cpu_count()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        # Sliding window of in-flight futures: submit 2*max_workers up
+        # front, then one more per completion. Memory stays bounded (PGNs
+        # aren't all pinned in the queue) and Ctrl-C cancels promptly.
+        args_iter = iter(game_args)
+        pending = {executor.submit(analyze_game_worker_fixed, arg)
+                   for arg in itertools.islice(args_iter, 2 * max_workers)}
+        done_count = 0
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game_id, errors = future.result()
+                results.append((game_id, errors))
+                all_errors.extend(errors)
+                done_count += 1
+                print(f"Analyzed game {done_count}/{len(game_args)}: {len(errors)} errors found")
+                next_arg = next(args_iter, None)
+                if next_arg is not None:
+                    pending.add(executor.submit(analyze_game_worker_fixed, next_arg))
+
+    # Persist everything in one transaction instead of a commit per game
+    db.save_analyses(results, ANALYZER_VERSION)
     
     # Show summary
     print(f"\n📊 Analysis Complete!")
     print(f"Total errors found: {len(all_errors)}")
-    
+
     if all_errors:
-        from collections import Counter
-        white_errors = [e for e in all_errors if e.get('player') == 'White']
-        black_errors = [e for e in all_errors if e.get('player') == 'Black']
-        
-        print(f"White errors: {len(white_errors)} ({len(white_errors)/len(all_errors)*100:.1f}%)")
-        print(f"Black errors: {len(black_errors)} ({len(black_errors)/len(all_errors)*100:.1f}%)")
-        
+        # One pass over the errors instead of a list comprehension per color
+        white_count = black_count = 0
+        for error in all_errors:
+            player = error.get('player')
+            if player == 'White':
+                white_count += 1
+            elif player == 'Black':
+                black_count += 1
+
+        print(f"White errors: {white_count} ({white_count/len(all_errors)*100:.1f}%)")
+        print(f"Black errors: {black_count} ({black_count/len(all_errors)*100:.1f}%)")
+
         print(f"\nSample errors with colors:")
         for i, error in enumerate(all_errors[:10]):
             print(f"  {i+1}. {error['san_move']} ({error.get('player', 'Unknown')}) - {error['error_type']}")
-    
+
     print(f"\n✅ Database fixed and re-analyzed!")
 
 if __name__ == "__main__":
@@ -4,74 +4,168 @@ Analyze last 50 games, find common mistakes, and get improvement suggestions fro
 """
 
 from fetch import ChessComAPI
-from analyze import ChessAnalyzer
+from analyze import ChessAnalyzer, ANALYZER_VERSION
 from explain import ChessExplainer
 from utils import load_environment, load_username
 from database import ChessDatabase
 from collections import Counter
+from itertools import pairwise
+import argparse
+import atexit
+import logging
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import requests
 import time
 
+try:
+    # Optional: progress bar for the analysis pool; falls back to prints
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+# Per-game chatter goes through the debug level - with thousands of games
+# the stdout writes (one syscall each) visibly throttle the archive scan
+log = logging.getLogger(__name__)
+
+# Chess.com result codes that count as a loss; frozenset membership is a
+# hash lookup instead of a list scan per game
+LOST_RESULTS = frozenset([
+    'checkmated', 'timeout', 'resigned', 'lose', 'abandoned',
+    'timeout vs computer',
+])
+
+# SAN move tokens (piece moves, pawn moves/promotions, castling) for the
+# cheap ply count - no full PGN parse needed to size a game
+_SAN_TOKEN_RE = re.compile(
+    r'\b(?:[KQRBN][a-h]?[1-8]?x?[a-h][1-8]|[a-h]x?[a-h]?[1-8](?:=[QRBN])?|O-O(?:-O)?)[+#]?'
+)
+
+# Move context sets for phase classification - frozensets make the
+# membership tests O(1), built once at import instead of per run
+OPENING_MOVES = frozenset(['e4', 'd4', 'Nf3', 'Nc3', 'Bf4', 'Bc4', 'O-O', 'O-O-O'])
+MIDDLE_GAME_MOVES = frozenset(['f4', 'e5', 'd5', 'c5', 'b3', 'g3', 'h3', 'a3'])
+TACTICAL_MOVES = frozenset(['Nxe4', 'Bxf7', 'Qxd4', 'Rxe8', 'Nxf6'])
+
+# One analyzer (and Stockfish engine) per pool worker, created once by the
+# initializer and reused for every game the worker picks up
+_worker_analyzer = None
+
+
+def _init_worker():
+    """Create the persistent single-engine analyzer for a pool worker process."""
+    global _worker_analyzer
+    # The process pool already provides the N-way parallelism, so each
+    # worker runs exactly one engine; the default pool_size (cpu_count)
+    # would spawn cpu_count engines per worker and thrash the machine.
+    # Each worker opens its own database connection (safe under WAL) so
+    # the persistent FEN->eval cache works inside the pool too.
+    _worker_analyzer = ChessAnalyzer(db=ChessDatabase(), pool_size=1)
+    atexit.register(_worker_analyzer.close_engine)
+
 
 def analyze_game_worker(args):
-    pgn, username, game_id, db = args
-    analyzer = ChessAnalyzer()
-    analyzer.initialize_engine()
-    try:
-        errors = analyzer.analyze_game(pgn, username)
-        # Save analysis to database
-        if db:
-            db.save_analysis(game_id, errors)
-        return errors
-    finally:
-        analyzer.close_engine()
+    """Analyze one game on the worker's persistent engine."""
+    pgn, username, game_id, max_plies = args
+    return game_id, _worker_analyzer.analyze_game(pgn, username, max_plies=max_plies)
+
+
+def _count_plies(pgn):
+    """Count plies in a PGN's movetext with a regex, skipping the headers."""
+    movetext = pgn.split('\n\n', 1)[-1]
+    return len(_SAN_TOKEN_RE.findall(movetext))
+
+
+def _format_counter_lines(counter, total=None, top=None, empty="- No data"):
+    """
+    Format a counter as markdown bullet lines.
+
+    Formatted once and shared between the GPT prompt and the saved
+    report so the same Counter is never rendered twice.
+
+    Args:
+        counter: Counter to render
+        total: If given, append each count's percentage of this total
+        top: If given, keep only the most common entries
+        empty: Single line returned when there is nothing to show
+
+    Returns:
+        List of formatted lines
+    """
+    if total:
+        lines = [f"- {key}: {count} ({count/total*100:.1f}%)"
+                 for key, count in counter.most_common(top)]
+    else:
+        lines = [f"- {key}: {count} times" for key, count in counter.most_common(top)]
+    return lines or [empty]
 
 
 def get_lost_games_from_year(api, username, year):
     """Fetch all lost games for the user from a specific year."""
     lost_games = []
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; ChessAnalyzer/1.0)"}
-    # Get list of archive URLs
+    username_lower = username.lower()
+    # Get list of archive URLs over the API's pooled session (connection
+    # reuse + retry/backoff come from ChessComAPI)
     archives_url = f"https://api.chess.com/pub/player/{username}/games/archives"
-    resp = requests.get(archives_url, headers=headers)
+    resp = api.get(archives_url, timeout=10)
     if resp.status_code != 200:
         print(f"Failed to fetch archives for {username} (status {resp.status_code})")
         print(f"Response: {resp.text}")
         return []
     archive_urls = [url for url in resp.json().get('archives', [])[::-1] if f"/{year}/" in url]
     print(f"Found {len(archive_urls)} monthly archives for {year}.")
-    
-    for idx, archive_url in enumerate(archive_urls):
-        month_resp = requests.get(archive_url, headers=headers)
-        if month_resp.status_code != 200:
-            print(f"Failed to fetch archive {archive_url} (status {month_resp.status_code})")
-            print(f"Response: {month_resp.text}")
-            continue
-        month_games = month_resp.json().get('games', [])
-        print(f"Archive {archive_url}: {len(month_games)} games found.")
+
+    def fetch_month(archive_url):
+        try:
+            # Closed months are immutable, so get_archive serves them from
+            # the on-disk cache; only the current month hits the network
+            # (with a conditional GET)
+            return api.get_archive(archive_url).get('games', [])
+        except requests.RequestException as e:
+            print(f"Failed to fetch archive {archive_url}: {e}")
+            return []
+
+    # Fetch every month concurrently - this is network-bound, so wall time
+    # is dominated by the slowest request instead of the sum of them all
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        month_results = list(executor.map(fetch_month, archive_urls))
+
+    for archive_url, month_games in zip(archive_urls, month_results):
+        log.debug("Archive %s: %d games found.", archive_url, len(month_games))
         for game in month_games:
-            white = game.get('white', {}).get('username', '').lower()
-            black = game.get('black', {}).get('username', '').lower()
-            white_result = game.get('white', {}).get('result', '').lower()
-            black_result = game.get('black', {}).get('result', '').lower()
-            user_is_white = username.lower() == white
-            user_is_black = username.lower() == black
-            if user_is_white and white_result in ['checkmated', 'timeout', 'resigned', 'lose', 'abandoned', 'timeout vs computer']:
+            white = game.get('white', {})
+            black = game.get('black', {})
+            white_result = white.get('result', '').lower()
+            black_result = black.get('result', '').lower()
+            user_is_white = username_lower == white.get('username', '').lower()
+            user_is_black = username_lower == black.get('username', '').lower()
+            if user_is_white and white_result in LOST_RESULTS:
                 lost_games.append(game)
-                print(f"Found lost game as White: {white_result}")
-            elif user_is_black and black_result in ['checkmated', 'timeout', 'resigned', 'lose', 'abandoned', 'timeout vs computer']:
+                log.debug("Found lost game as White: %s", white_result)
+            elif user_is_black and black_result in LOST_RESULTS:
                 lost_games.append(game)
-                print(f"Found lost game as Black: {black_result}")
+                log.debug("Found lost game as Black: %s", black_result)
     print(f"Collected {len(lost_games)} lost games in {year}.")
     return lost_games
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze lost games and get improvement suggestions")
+    parser.add_argument('--max-plies', type=int, default=120,
+                        help='Stop engine analysis after this many plies per game (default: 120)')
+    parser.add_argument('--min-plies', type=int, default=20,
+                        help='Skip engine analysis for games shorter than this many plies (default: 20)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Print per-game progress instead of summaries only')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(message)s')
+
     print("♟️  Chess LLM Improvement Suggestions")
     print("=" * 50)
-    
+
     load_environment()
     username = load_username()
     if not username:
@@ -102,40 +196,77 @@ def main():
     
     # Add games to database and check which need analysis
     games_to_analyze = []
-    cached_games = []
-    
-    for game in lost_games:
-        if game.get('pgn'):
-            game_id = db.add_game(game, username)
-            game['game_id'] = game_id
-            
-            if db.game_analyzed(game_id):
-                # Get cached analysis
-                cached_errors = db.get_analysis(game_id)
-                cached_games.append(cached_errors)
-                print(f"📋 Using cached analysis for game {game_id[:8]}... ({len(cached_errors)} errors)")
-            else:
-                games_to_analyze.append(game)
-                print(f"🔄 Game {game_id[:8]}... needs analysis")
-    
-    # Combine cached and new analysis
     all_errors = []
-    all_errors.extend([error for game_errors in cached_games for error in game_errors])
-    
+
+    games_with_pgn = [game for game in lost_games if game.get('pgn')]
+    # Insert the whole batch in one transaction
+    for game, game_id in zip(games_with_pgn, db.add_games(games_with_pgn, username)):
+        game['game_id'] = game_id
+
+    # One bulk query for every cached analysis instead of two SQLite
+    # round-trips (game_analyzed + get_analysis) per game
+    cached_analyses = db.get_analyses_bulk([game['game_id'] for game in games_with_pgn])
+
+    # game_id is a blake2b hash of the PGN, so byte-identical games (e.g.
+    # re-imports) share an ID - analyze each distinct PGN only once
+    queued_ids = set()
+    for game in games_with_pgn:
+        game_id = game['game_id']
+        if game_id in cached_analyses:
+            cached_errors = cached_analyses[game_id]
+            all_errors.extend(cached_errors)
+            log.debug("📋 Using cached analysis for game %s... (%d errors)", game_id[:8], len(cached_errors))
+        elif game_id in queued_ids:
+            log.debug("♻️  Skipping duplicate of game %s...", game_id[:8])
+        else:
+            queued_ids.add(game_id)
+            games_to_analyze.append(game)
+            log.debug("🔄 Game %s... needs analysis", game_id[:8])
+
+    # Tiny games (early timeouts, aborts) rarely hold interesting errors
+    # but still cost a worker dispatch - screen them out with a cheap
+    # regex ply count before any engine work
+    if args.min_plies:
+        long_enough = []
+        short_count = 0
+        for game in games_to_analyze:
+            if _count_plies(game.get('pgn', '')) < args.min_plies:
+                short_count += 1
+            else:
+                long_enough.append(game)
+        if short_count:
+            print(f"⏭️  Skipping {short_count} games shorter than {args.min_plies} plies")
+        games_to_analyze = long_enough
+
     # Analyze new games if any
     if games_to_analyze:
         print(f"\n🔄 Analyzing {len(games_to_analyze)} new games...")
         explainer = ChessExplainer()
         
-        # Prepare arguments for parallel analysis
-        game_args = [(game.get('pgn'), username, game.get('game_id'), db) for game in games_to_analyze]
-        
-        with ProcessPoolExecutor() as executor:
-            futures = [executor.submit(analyze_game_worker, arg) for arg in game_args]
-            for i, future in enumerate(as_completed(futures), 1):
-                errors = future.result()
+        # Prepare arguments for parallel analysis. The db handle stays in
+        # the parent - workers only analyze, the parent persists results.
+        game_args = [(game.get('pgn'), username, game.get('game_id'), args.max_plies)
+                     for game in games_to_analyze]
+
+        results = []
+        max_workers = os.cpu_count()
+        # Chunked map amortizes pickling/IPC across several games per
+        # dispatch; each worker reuses one engine for its whole lifetime
+        chunksize = max(1, len(game_args) // (4 * max_workers))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+            mapped = executor.map(analyze_game_worker, game_args, chunksize=chunksize)
+            if tqdm is not None:
+                mapped = tqdm(mapped, total=len(game_args), desc="Analyzing games", unit="game")
+            for i, (game_id, errors) in enumerate(mapped, 1):
+                results.append((game_id, errors))
                 all_errors.extend(errors)
-                print(f"Analyzed game {i}/{len(game_args)}: {len(errors)} errors found")
+                if tqdm is None:
+                    log.debug("Analyzed game %d/%d: %d errors found", i, len(game_args), len(errors))
+
+        # Persist everything in one transaction instead of a commit per
+        # game, stamped with the shared analyzer version so fix_analysis
+        # doesn't re-analyze games this run already handled
+        db.save_analyses(results, ANALYZER_VERSION)
     else:
         print(f"\n✅ All {len(lost_games)} games already analyzed! Using cached results.")
     
@@ -143,57 +274,69 @@ def main():
         print("No errors found in lost games!")
         return
     
-    # Enhanced analysis for better GPT prompts
-    type_counts = Counter(e['error_type'] for e in all_errors)
-    move_counts = Counter(e['san_move'] for e in all_errors)
-    
-    # Analyze color-specific patterns
-    white_errors = [e for e in all_errors if e.get('player') == 'White']
-    black_errors = [e for e in all_errors if e.get('player') == 'Black']
-    
-    white_type_counts = Counter(e['error_type'] for e in white_errors)
-    black_type_counts = Counter(e['error_type'] for e in black_errors)
-    white_move_counts = Counter(e['san_move'] for e in white_errors)
-    black_move_counts = Counter(e['san_move'] for e in black_errors)
-    
-    # Analyze move context and patterns
-    opening_moves = ['e4', 'd4', 'Nf3', 'Nc3', 'Bf4', 'Bc4', 'O-O', 'O-O-O']
-    middle_game_moves = ['f4', 'e5', 'd5', 'c5', 'b3', 'g3', 'h3', 'a3']
-    tactical_moves = ['Nxe4', 'Bxf7', 'Qxd4', 'Rxe8', 'Nxf6']
-    
-    opening_errors = [e for e in all_errors if e['san_move'] in opening_moves]
-    middle_game_errors = [e for e in all_errors if e['san_move'] in middle_game_moves]
-    tactical_errors = [e for e in all_errors if e['san_move'] in tactical_moves]
-    
-    # Analyze evaluation patterns
-    blunders = [e for e in all_errors if e['error_type'] == 'Blunder']
-    mistakes = [e for e in all_errors if e['error_type'] == 'Mistake']
-    inaccuracies = [e for e in all_errors if e['error_type'] == 'Inaccuracy']
-    
-    # Calculate average evaluation drops
-    def avg_eval_drop(errors):
-        if not errors:
-            return 0
-        return sum(abs(e.get('eval_change', 0)) for e in errors) / len(errors)
-    
-    avg_blunder_drop = avg_eval_drop(blunders)
-    avg_mistake_drop = avg_eval_drop(mistakes)
-    avg_inaccuracy_drop = avg_eval_drop(inaccuracies)
-    
-    # Find most problematic move combinations
-    move_combinations = []
-    for i in range(len(all_errors) - 1):
-        move_combinations.append((all_errors[i]['san_move'], all_errors[i+1]['san_move']))
-    combo_counts = Counter(move_combinations)
+    # Enhanced analysis for better GPT prompts - every aggregate comes out
+    # of a single pass over the errors instead of a dozen comprehensions
+    # that each rescan the whole list
+    type_counts = Counter()
+    move_counts = Counter()
+    white_type_counts = Counter()
+    black_type_counts = Counter()
+    white_move_counts = Counter()
+    black_move_counts = Counter()
+    eval_drop_sums = Counter()
+    white_count = black_count = 0
+    san_moves = []
+    total_errors = len(all_errors)
+
+    for error in all_errors:
+        error_type = error['error_type']
+        san_move = error['san_move']
+        type_counts[error_type] += 1
+        move_counts[san_move] += 1
+        eval_drop_sums[error_type] += abs(error.get('eval_change', 0))
+        san_moves.append(san_move)
+
+        player = error.get('player')
+        if player == 'White':
+            white_count += 1
+            white_type_counts[error_type] += 1
+            white_move_counts[san_move] += 1
+        elif player == 'Black':
+            black_count += 1
+            black_type_counts[error_type] += 1
+            black_move_counts[san_move] += 1
+
+    # Phase counts come from the aggregated move multiset: intersecting
+    # each reference set with the distinct moves probes a handful of keys
+    # instead of testing all three sets against every single error
+    def phase_count(move_set):
+        return sum(move_counts[move] for move in move_set & move_counts.keys())
+
+    opening_count = phase_count(OPENING_MOVES)
+    middle_game_count = phase_count(MIDDLE_GAME_MOVES)
+    tactical_count = phase_count(TACTICAL_MOVES)
+
+    # Average evaluation drop per error type from the accumulated sums
+    def avg_eval_drop(error_type):
+        count = type_counts[error_type]
+        return eval_drop_sums[error_type] / count if count else 0
+
+    avg_blunder_drop = avg_eval_drop('Blunder')
+    avg_mistake_drop = avg_eval_drop('Mistake')
+    avg_inaccuracy_drop = avg_eval_drop('Inaccuracy')
+
+    # Find most problematic move combinations - pairwise iterates the
+    # consecutive pairs without copying the move list for the offset
+    combo_counts = Counter(pairwise(san_moves))
     
     print("\n=== DETAILED ANALYSIS ===")
-    print(f"Total errors analyzed: {len(all_errors)}")
+    print(f"Total errors analyzed: {total_errors}")
     print(f"Games analyzed: {len(lost_games)}")
-    print(f"Average errors per game: {len(all_errors)/len(lost_games):.1f}")
+    print(f"Average errors per game: {total_errors/len(lost_games):.1f}")
     
     print(f"\nColor Performance:")
-    print(f"  White errors: {len(white_errors)} ({len(white_errors)/len(all_errors)*100:.1f}%)")
-    print(f"  Black errors: {len(black_errors)} ({len(black_errors)/len(all_errors)*100:.1f}%)")
+    print(f"  White errors: {white_count} ({white_count/total_errors*100:.1f}%)")
+    print(f"  Black errors: {black_count} ({black_count/total_errors*100:.1f}%)")
     
     # Debug: Show a few sample errors with their color
     if all_errors:
@@ -203,15 +346,15 @@ def main():
     
     print("\nError Types (Overall):")
     for t, count in type_counts.most_common():
-        print(f"  {t}: {count} ({count/len(all_errors)*100:.1f}%)")
+        print(f"  {t}: {count} ({count/total_errors*100:.1f}%)")
     
     print("\nError Types (White):")
     for t, count in white_type_counts.most_common():
-        print(f"  {t}: {count} ({count/len(white_errors)*100:.1f}%)" if white_errors else "  No white errors")
+        print(f"  {t}: {count} ({count/white_count*100:.1f}%)" if white_count else "  No white errors")
     
     print("\nError Types (Black):")
     for t, count in black_type_counts.most_common():
-        print(f"  {t}: {count} ({count/len(black_errors)*100:.1f}%)" if black_errors else "  No black errors")
+        print(f"  {t}: {count} ({count/black_count*100:.1f}%)" if black_count else "  No black errors")
     
     print("\nMost Common Error Moves (Overall):")
     for move, count in move_counts.most_common(10):
@@ -226,9 +369,9 @@ def main():
         print(f"  {move}: {count} times")
     
     print(f"\nPhase Analysis:")
-    print(f"  Opening errors: {len(opening_errors)} ({len(opening_errors)/len(all_errors)*100:.1f}%)")
-    print(f"  Middle game errors: {len(middle_game_errors)} ({len(middle_game_errors)/len(all_errors)*100:.1f}%)")
-    print(f"  Tactical errors: {len(tactical_errors)} ({len(tactical_errors)/len(all_errors)*100:.1f}%)")
+    print(f"  Opening errors: {opening_count} ({opening_count/total_errors*100:.1f}%)")
+    print(f"  Middle game errors: {middle_game_count} ({middle_game_count/total_errors*100:.1f}%)")
+    print(f"  Tactical errors: {tactical_count} ({tactical_count/total_errors*100:.1f}%)")
     
     print(f"\nEvaluation Impact:")
     print(f"  Average blunder: -{avg_blunder_drop:.2f} pawns")
@@ -240,43 +383,57 @@ def main():
         for (move1, move2), count in combo_counts.most_common(3):
             print(f"  {move1} → {move2}: {count} times")
     
+    # Format the breakdown tables once; the prompt and the markdown report
+    # below both reuse these lines instead of re-walking the Counters
+    sections = {
+        'types_overall': _format_counter_lines(type_counts, total=total_errors),
+        'types_white': _format_counter_lines(white_type_counts, total=white_count, empty="- No white errors"),
+        'types_black': _format_counter_lines(black_type_counts, total=black_count, empty="- No black errors"),
+        'moves_overall': _format_counter_lines(move_counts, top=10),
+        'moves_white': _format_counter_lines(white_move_counts, top=5, empty="- No white errors"),
+        'moves_black': _format_counter_lines(black_move_counts, top=5, empty="- No black errors"),
+    }
+    combo_lines = ([f"- {move1} → {move2}: {count} times"
+                    for (move1, move2), count in combo_counts.most_common(3)]
+                   or ["- No clear patterns detected"])
+
     # Create enhanced prompt with color context
     enhanced_prompt = f"""
 You are a chess improvement coach analyzing a player's performance. Here is a detailed analysis of their last {len(lost_games)} lost games:
 
 **GAME STATISTICS:**
 - Total games analyzed: {len(lost_games)}
-- Total errors found: {len(all_errors)}
-- Average errors per game: {len(all_errors)/len(lost_games):.1f}
+- Total errors found: {total_errors}
+- Average errors per game: {total_errors/len(lost_games):.1f}
 
 **COLOR PERFORMANCE:**
-- White errors: {len(white_errors)} ({len(white_errors)/len(all_errors)*100:.1f}%)
-- Black errors: {len(black_errors)} ({len(black_errors)/len(all_errors)*100:.1f}%)
+- White errors: {white_count} ({white_count/total_errors*100:.1f}%)
+- Black errors: {black_count} ({black_count/total_errors*100:.1f}%)
 
 **ERROR BREAKDOWN (OVERALL):**
-{chr(10).join(f"- {t}: {count} ({count/len(all_errors)*100:.1f}%)" for t, count in type_counts.most_common())}
+{chr(10).join(sections['types_overall'])}
 
 **ERROR BREAKDOWN BY COLOR:**
 **WHITE PLAY:**
-{chr(10).join(f"- {t}: {count} ({count/len(white_errors)*100:.1f}%)" for t, count in white_type_counts.most_common()) if white_errors else "- No white errors"}
+{chr(10).join(sections['types_white'])}
 
 **BLACK PLAY:**
-{chr(10).join(f"- {t}: {count} ({count/len(black_errors)*100:.1f}%)" for t, count in black_type_counts.most_common()) if black_errors else "- No black errors"}
+{chr(10).join(sections['types_black'])}
 
 **MOST PROBLEMATIC MOVES (OVERALL):**
-{chr(10).join(f"- {move}: {count} times" for move, count in move_counts.most_common(8))}
+{chr(10).join(sections['moves_overall'][:8])}
 
 **MOST PROBLEMATIC MOVES BY COLOR:**
 **WHITE MOVES:**
-{chr(10).join(f"- {move}: {count} times" for move, count in white_move_counts.most_common(5)) if white_errors else "- No white errors"}
+{chr(10).join(sections['moves_white'])}
 
 **BLACK MOVES:**
-{chr(10).join(f"- {move}: {count} times" for move, count in black_move_counts.most_common(5)) if black_errors else "- No black errors"}
+{chr(10).join(sections['moves_black'])}
 
 **GAME PHASE ANALYSIS:**
-- Opening errors: {len(opening_errors)} ({len(opening_errors)/len(all_errors)*100:.1f}%)
-- Middle game errors: {len(middle_game_errors)} ({len(middle_game_errors)/len(all_errors)*100:.1f}%)
-- Tactical errors: {len(tactical_errors)} ({len(tactical_errors)/len(all_errors)*100:.1f}%)
+- Opening errors: {opening_count} ({opening_count/total_errors*100:.1f}%)
+- Middle game errors: {middle_game_count} ({middle_game_count/total_errors*100:.1f}%)
+- Tactical errors: {tactical_count} ({tactical_count/total_errors*100:.1f}%)
 
 **EVALUATION IMPACT:**
 - Average blunder: -{avg_blunder_drop:.2f} pawns
@@ -284,7 +441,7 @@ You are a chess improvement coach analyzing a player's performance. Here is a de
 - Average inaccuracy: -{avg_inaccuracy_drop:.2f} pawns
 
 **ERROR PATTERNS:**
-{chr(10).join(f"- {move1} → {move2}: {count} times" for (move1, move2), count in combo_counts.most_common(3)) if combo_counts else "- No clear patterns detected"}
+{chr(10).join(combo_lines)}
 
 Based on this detailed analysis, provide:
 
@@ -310,64 +467,46 @@ Be very specific, mention the exact moves they struggle with for each color, and
     outdir = "reports"
     if not os.path.exists(outdir):
         os.makedirs(outdir)
+    # Assemble the report in memory and write it with a single call,
+    # reusing the section lines already built for the prompt
+    report_parts = [
+        "# Chess Improvement Analysis\n\n",
+        f"## Player: {username}\n\n",
+        "## Analysis Summary\n\n",
+        f"- **Games Analyzed**: {len(lost_games)}\n",
+        f"- **Total Errors**: {total_errors}\n",
+        f"- **Average Errors per Game**: {total_errors/len(lost_games):.1f}\n\n",
+        "### Color Performance\n",
+        f"- White errors: {white_count} ({white_count/total_errors*100:.1f}%)\n",
+        f"- Black errors: {black_count} ({black_count/total_errors*100:.1f}%)\n\n",
+        "### Error Types (Overall)\n",
+        '\n'.join(sections['types_overall']) + "\n\n",
+        "### Error Types (White)\n",
+        '\n'.join(sections['types_white']) + "\n\n",
+        "### Error Types (Black)\n",
+        '\n'.join(sections['types_black']) + "\n\n",
+        "### Most Common Error Moves (Overall)\n",
+        '\n'.join(sections['moves_overall']) + "\n\n",
+        "### Most Common Error Moves (White)\n",
+        '\n'.join(sections['moves_white']) + "\n\n",
+        "### Most Common Error Moves (Black)\n",
+        '\n'.join(sections['moves_black']) + "\n\n",
+        "### Game Phase Analysis\n",
+        f"- Opening errors: {opening_count} ({opening_count/total_errors*100:.1f}%)\n",
+        f"- Middle game errors: {middle_game_count} ({middle_game_count/total_errors*100:.1f}%)\n",
+        f"- Tactical errors: {tactical_count} ({tactical_count/total_errors*100:.1f}%)\n\n",
+        "### Evaluation Impact\n",
+        f"- Average blunder: -{avg_blunder_drop:.2f} pawns\n",
+        f"- Average mistake: -{avg_mistake_drop:.2f} pawns\n",
+        f"- Average inaccuracy: -{avg_inaccuracy_drop:.2f} pawns\n\n",
+        "## Improvement Suggestions\n\n",
+        suggestions or "",
+        "\n",
+        "---\n",
+        f"*Analysis generated on {time.strftime('%Y-%m-%d %H:%M:%S')}*\n",
+    ]
     with open(os.path.join(outdir, f"improvement_{username}.md"), "w", encoding="utf-8") as f:
-        f.write("# Chess Improvement Analysis\n\n")
-        f.write(f"## Player: {username}\n\n")
-        f.write(f"## Analysis Summary\n\n")
-        f.write(f"- **Games Analyzed**: {len(lost_games)}\n")
-        f.write(f"- **Total Errors**: {len(all_errors)}\n")
-        f.write(f"- **Average Errors per Game**: {len(all_errors)/len(lost_games):.1f}\n\n")
-        
-        f.write("### Color Performance\n")
-        f.write(f"- White errors: {len(white_errors)} ({len(white_errors)/len(all_errors)*100:.1f}%)\n")
-        f.write(f"- Black errors: {len(black_errors)} ({len(black_errors)/len(all_errors)*100:.1f}%)\n\n")
-        
-        f.write("### Error Types (Overall)\n")
-        for t, count in type_counts.most_common():
-            f.write(f"- {t}: {count} ({count/len(all_errors)*100:.1f}%)\n")
-        f.write("\n")
-        
-        f.write("### Error Types (White)\n")
-        for t, count in white_type_counts.most_common():
-            f.write(f"- {t}: {count} ({count/len(white_errors)*100:.1f}%)" if white_errors else "- No white errors\n")
-        f.write("\n")
-        
-        f.write("### Error Types (Black)\n")
-        for t, count in black_type_counts.most_common():
-            f.write(f"- {t}: {count} ({count/len(black_errors)*100:.1f}%)" if black_errors else "- No black errors\n")
-        f.write("\n")
-        
-        f.write("### Most Common Error Moves (Overall)\n")
-        for move, count in move_counts.most_common(10):
-            f.write(f"- {move}: {count} times\n")
-        f.write("\n")
-        
-        f.write("### Most Common Error Moves (White)\n")
-        for move, count in white_move_counts.most_common(5):
-            f.write(f"- {move}: {count} times\n")
-        f.write("\n")
-        
-        f.write("### Most Common Error Moves (Black)\n")
-        for move, count in black_move_counts.most_common(5):
-            f.write(f"- {move}: {count} times\n")
-        f.write("\n")
-        
-        f.write("### Game Phase Analysis\n")
-        f.write(f"- Opening errors: {len(opening_errors)} ({len(opening_errors)/len(all_errors)*100:.1f}%)\n")
-        f.write(f"- Middle game errors: {len(middle_game_errors)} ({len(middle_game_errors)/len(all_errors)*100:.1f}%)\n")
-        f.write(f"- Tactical errors: {len(tactical_errors)} ({len(tactical_errors)/len(all_errors)*100:.1f}%)\n\n")
-        
-        f.write("### Evaluation Impact\n")
-        f.write(f"- Average blunder: -{avg_blunder_drop:.2f} pawns\n")
-        f.write(f"- Average mistake: -{avg_mistake_drop:.2f} pawns\n")
-        f.write(f"- Average inaccuracy: -{avg_inaccuracy_drop:.2f} pawns\n\n")
-        
-        f.write("## Improvement Suggestions\n\n")
-        f.write(suggestions)
-        f.write("\n")
-        
-        f.write("---\n")
-        f.write(f"*Analysis generated on {time.strftime('%Y-%m-%d %H:%M:%S')}*\n")
+        f.write("".join(report_parts))
     
     print(f"\n✅ Detailed analysis saved to {os.path.join(outdir, f'improvement_{username}.md')}")
     
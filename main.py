@@ -5,6 +5,7 @@ Main application for Chess LLM Analyzer.
 
 import os
 import sys
+from database import ChessDatabase
 from fetch import ChessComAPI
 from analyze import ChessAnalyzer
 from explain import ChessExplainer
@@ -25,9 +26,11 @@ def main():
         print("Please set your OpenAI API key in the .env file.")
         return
     
-    # Initialize components
+    # Initialize components. The database doubles as a persistent FEN->eval
+    # cache, so positions seen in earlier runs skip the engine search
     api = ChessComAPI()
-    analyzer = ChessAnalyzer()
+    db = ChessDatabase()
+    analyzer = ChessAnalyzer(db=db)
     explainer = ChessExplainer()
     report_gen = ReportGenerator()
     
@@ -153,12 +156,13 @@ def main():
                 print(f"\n🤖 Getting AI explanations for top {max_errors_to_explain} errors...")
                 explained_errors = explainer.explain_errors_batch(errors_to_explain, max_errors_to_explain)
             
-            # Generate report
+            # Generate report, streaming the fragments straight to disk
+            # instead of materializing the full string first
             print(f"\n📝 Generating report...")
-            report_content = report_gen.generate_report(username, games, explained_errors)
-            
+            report_parts = report_gen.generate_report_parts(username, games, explained_errors)
+
             # Save report
-            filename = report_gen.save_report(report_content, username)
+            filename = report_gen.save_report_parts(report_parts, username)
             print(f"✅ Report saved to: {filename}")
             
             # Display summary in terminal
@@ -73,19 +73,22 @@ def test_single_game_analysis():
             # Let's check a few moves to see what the evaluations look like
             print("\nChecking first 10 moves for evaluation patterns:")
             
-            import chess.pgn
-            from io import StringIO
-            
-            pgn_io = StringIO(pgn)
-            game_obj = chess.pgn.read_game(pgn_io)
+            import chess.engine
+            from itertools import islice
+
+            # Reuse the game analyze_game already parsed instead of
+            # tokenizing the PGN a second time
+            game_obj = analyzer._last_game
             board = game_obj.board()
-            
-            for i, move in enumerate(game_obj.mainline_moves()):
-                if i >= 10:
-                    break
-                    
+
+            # Fixed depth instead of time=0.1 per probe: deterministic and
+            # typically returns well before the 0.1s wall-clock budget, so
+            # the 10-move check no longer serializes a full second of engine
+            # time
+            limit = chess.engine.Limit(depth=10)
+            for i, move in enumerate(islice(game_obj.mainline_moves(), 10)):
                 # Get evaluation before move
-                info = analyzer.engine.analyse(board, chess.engine.Limit(time=0.1))
+                info = analyzer.engine.analyse(board, limit)
                 eval_score = info.get('score')
                 if eval_score:
                     eval_centipawns = eval_score.white().score(mate_score=10000)
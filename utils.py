@@ -4,11 +4,21 @@ Utility functions for the Chess Insight Analyzer.
 
 import os
 import json
+import threading
 from dotenv import load_dotenv
 from typing import Dict, Any, Optional
 
 CONFIG_FILE = "config.json"
 
+# Shared read-only default for dict.get so missing keys don't allocate a
+# fresh dict per lookup
+_EMPTY_DICT = {}
+
+# Parsed config cached against the file's mtime so repeated
+# load_username/load_config calls skip the open() and json parse
+_config_cache = {'mtime': None, 'data': None}
+_config_lock = threading.Lock()
+
 def load_environment() -> None:
     """Load environment variables from .env file."""
     load_dotenv()
@@ -32,66 +42,97 @@ def load_username() -> Optional[str]:
     return config.get('username')
 
 def load_config() -> Dict[str, Any]:
-    """Load configuration from file."""
-    if os.path.exists(CONFIG_FILE):
+    """Load configuration from file, served from cache while unchanged."""
+    with _config_lock:
+        try:
+            mtime = os.path.getmtime(CONFIG_FILE)
+        except OSError:
+            return {}
+        if mtime == _config_cache['mtime']:
+            return _config_cache['data'].copy()
         try:
             with open(CONFIG_FILE, 'r') as f:
-                return json.load(f)
+                data = json.load(f)
         except (json.JSONDecodeError, IOError):
             return {}
-    return {}
+        _config_cache['mtime'] = mtime
+        _config_cache['data'] = data
+        return data.copy()
 
 def save_config(config: Dict[str, Any]) -> None:
     """Save configuration to file."""
     try:
         with open(CONFIG_FILE, 'w') as f:
             json.dump(config, f, indent=2)
+        with _config_lock:
+            _config_cache['mtime'] = os.path.getmtime(CONFIG_FILE)
+            _config_cache['data'] = config.copy()
     except IOError as e:
         print(f"Warning: Could not save config file: {e}")
 
+# Bound C-level formatter: the '+' spec handles the sign, so the hot path
+# is one call with no Python-level branching
+_fmt_eval = "{:+.2f}".format
+
 def format_evaluation(eval_score: float) -> str:
     """Format evaluation score for display."""
-    if eval_score > 0:
-        return f"+{eval_score:.2f}"
-    return f"{eval_score:.2f}"
+    return "0.00" if eval_score == 0 else _fmt_eval(eval_score)
 
 def format_move_number(move_number: int) -> str:
     """Format move number for display."""
     return f"{move_number}."
 
+def _resolve(game_data: Dict[str, Any], username: str) -> tuple:
+    """
+    Match the username against both sides of a game with one round of
+    lowercasing.
+
+    The three public helpers below (and report headers, which call all of
+    them for the same game) each lowercased the same usernames again; this
+    does the comparison once and hands back everything they need.
+
+    Args:
+        game_data: Game data from Chess.com API
+        username: Chess.com username
+
+    Returns:
+        Tuple of (color or None, white player dict, black player dict)
+    """
+    white_player = game_data.get('white', _EMPTY_DICT)
+    black_player = game_data.get('black', _EMPTY_DICT)
+    username_lower = username.lower()
+
+    if username_lower == white_player.get('username', '').lower():
+        return 'white', white_player, black_player
+    if username_lower == black_player.get('username', '').lower():
+        return 'black', white_player, black_player
+    return None, white_player, black_player
+
 def get_player_color(game_data: Dict[str, Any], username: str) -> str:
     """Determine if the player was white or black in the game."""
-    white_player = game_data.get('white', {}).get('username', '').lower()
-    black_player = game_data.get('black', {}).get('username', '').lower()
-    username_lower = username.lower()
-    
-    if username_lower == white_player:
-        return 'white'
-    elif username_lower == black_player:
-        return 'black'
-    else:
+    color, _, _ = _resolve(game_data, username)
+    if color is None:
         raise ValueError(f"Player {username} not found in game data")
+    return color
 
 def get_opponent_rating(game_data: Dict[str, Any], username: str) -> Optional[int]:
     """Get the opponent's rating from game data."""
-    white_player = game_data.get('white', {})
-    black_player = game_data.get('black', {})
-    username_lower = username.lower()
-    
-    if username_lower == white_player.get('username', '').lower():
+    color, white_player, black_player = _resolve(game_data, username)
+    if color == 'white':
         return black_player.get('rating')
-    elif username_lower == black_player.get('username', '').lower():
+    elif color == 'black':
         return white_player.get('rating')
     else:
         return None
 
 def get_game_result(game_data: Dict[str, Any], username: str) -> str:
     """Get the game result from the player's perspective."""
-    result = game_data.get('result', '')
-    username_lower = username.lower()
-    white_player = game_data.get('white', {}).get('username', '').lower()
-    
-    if username_lower == white_player:
+    color, _, _ = _resolve(game_data, username)
+    return _result_for_color(game_data.get('result', ''), color)
+
+def _result_for_color(result: str, color: Optional[str]) -> str:
+    """Map a raw result string to Win/Loss/Draw for the given color."""
+    if color == 'white':
         if result == '1-0':
             return 'Win'
         elif result == '0-1':